@@ -0,0 +1,4 @@
+"""Benchmarks for the Nextcloud Talk client.
+
+Run with `python -m benchmarks.run --help`.
+"""
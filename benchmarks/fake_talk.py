@@ -0,0 +1,265 @@
+"""An in-process stand-in for the Nextcloud Talk OCS API.
+
+FakeTalkServer answers the requests the client makes through an
+httpx.MockTransport, so no sockets or real server are involved.  Messages are
+generated at a fixed rate from a seeded random generator, so every run sees
+the same traffic.
+"""
+
+import asyncio
+import io
+import json
+import random
+import re
+import time
+import urllib.parse
+
+import httpx
+
+from typing import Any, Dict, List, Optional
+
+from PIL import Image as PILImage
+
+TALK_FEATURES = ['conversation-v4', 'chat-v2', 'chat-read-status', 'chat-reference-id']
+
+
+class FakeRoom:
+    def __init__(self, token: str, name: str):
+        self.token = token
+        self.name = name
+        self.messages: List[Dict[str, Any]] = []
+        self.changed = asyncio.Event()
+        self.modified = int(time.time())
+
+    def as_conversation(self) -> Dict[str, Any]:
+        return {
+            'id': int(self.token.removeprefix('room')),
+            'token': self.token,
+            'type': 2,
+            'name': self.name,
+            'displayName': self.name,
+            'unreadMessages': 0,
+            'lastMessage': self.messages[-1] if self.messages else [],
+            'lastActivity': self.messages[-1]['timestamp'] if self.messages else 0,
+        }
+
+
+class FakeTalkServer:
+    """Serve `rooms` rooms, posting `rate` messages per second across all of them.
+
+    A fraction `attachment_ratio` of messages are image attachments of
+    `attachment_size` pixels square.  Every room starts with `history`
+    messages.  `created` maps message ids to the time.monotonic() at which the
+    server posted them, for measuring how long they take to reach the screen.
+    """
+
+    endpoint = 'https://talk.benchmark.invalid'
+    user = 'benchmark'
+
+    def __init__(
+            self,
+            rooms: int = 10,
+            rate: float = 10,
+            attachment_ratio: float = 0.05,
+            attachment_size: int = 512,
+            history: int = 200,
+            seed: int = 0):
+
+        self.rate = rate
+        self.attachment_ratio = attachment_ratio
+        self.attachment_size = attachment_size
+        self.random = random.Random(seed)
+
+        self.rooms = {
+            f'room{i}': FakeRoom(f'room{i}', f'Benchmark Room {i}') for i in range(rooms)}
+        self.next_id = 1
+        self.created: Dict[int, float] = {}
+        self.requests = 0
+        self.bytes_served = 0
+        self.attachment = self.__make_attachment()
+        # Preview height -> PNG of the attachment scaled to it
+        self.previews: Dict[int, bytes] = {}
+
+        start = time.time() - history * 60
+        for room in self.rooms.values():
+            for i in range(history):
+                self.post(room, timestamp=int(start + i * 60), track=False)
+
+    def __make_attachment(self) -> bytes:
+        # Noise, so the PNG is about as large as a photo of that size
+        size = self.attachment_size
+        pixels = self.random.randbytes(size * size * 3)
+        buffer = io.BytesIO()
+        PILImage.frombytes('RGB', (size, size), pixels).save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    def __preview(self, height: int) -> bytes:
+        if height not in self.previews:
+            buffer = io.BytesIO()
+            image = PILImage.open(io.BytesIO(self.attachment))
+            image.thumbnail((height, height))
+            image.save(buffer, format='PNG')
+            self.previews[height] = buffer.getvalue()
+        return self.previews[height]
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    def post(
+            self,
+            room: FakeRoom,
+            message: Optional[str] = None,
+            timestamp: Optional[int] = None,
+            reference_id: Optional[str] = None,
+            track: bool = True) -> Dict[str, Any]:
+        """Add a message to `room`, waking any long-poll waiting on it."""
+        msg_id = self.next_id
+        self.next_id += 1
+
+        attachment = message is None and self.random.random() < self.attachment_ratio
+        msg = {
+            'id': msg_id,
+            'token': room.token,
+            'actorType': 'users',
+            'actorId': f'user{msg_id % 7}',
+            'actorDisplayName': f'User {msg_id % 7}',
+            'timestamp': timestamp or int(time.time()),
+            'systemMessage': '',
+            'messageType': 'comment',
+            'isReplyable': True,
+            'referenceId': reference_id or '',
+            'message': '{file}' if attachment else message or self.__sentence(),
+            'messageParameters': {},
+        }
+        if attachment:
+            msg['messageParameters'] = {'file': {
+                'type': 'file',
+                'id': str(msg_id),
+                'name': f'{msg_id}.png',
+                'path': f'Talk/{msg_id}.png',
+                'mimetype': 'image/png',
+                'preview-available': 'yes',
+                'size': len(self.attachment),
+            }}
+
+        room.messages.append(msg)
+        room.modified = int(time.time())
+        if track:
+            self.created[msg_id] = time.monotonic()
+        room.changed.set()
+        room.changed = asyncio.Event()
+        return msg
+
+    def __sentence(self) -> str:
+        letters = 'abcdefghijklmnopqrstuvwxyz'
+        return ' '.join(
+            ''.join(self.random.choices(letters, k=self.random.randint(2, 9)))
+            for _ in range(self.random.randint(3, 30)))
+
+    async def generate(self, duration: float):
+        """Post messages to random rooms at `rate` per second for `duration` seconds."""
+        rooms = list(self.rooms.values())
+        started = time.monotonic()
+        sent = 0
+        while (elapsed := time.monotonic() - started) < duration:
+            # Catch up after a late wakeup rather than drifting behind the rate.
+            while sent < elapsed * self.rate:
+                self.post(self.random.choice(rooms))
+                sent += 1
+            await asyncio.sleep(1 / self.rate)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        path = request.url.path
+        params = dict(urllib.parse.parse_qsl(request.url.query.decode()))
+
+        if path.startswith(f'/remote.php/dav/files/{self.user}/'):
+            return self.respond(httpx.Response(200, content=self.attachment))
+
+        if path == '/index.php/core/preview':
+            height = min(int(params.get('y', 0)), self.attachment_size)
+            return self.respond(httpx.Response(200, content=self.__preview(height)))
+
+        if path == '/status.php':
+            return self.respond(httpx.Response(
+                200, json={'installed': True, 'maintenance': False, 'version': '27.0.0'}))
+
+        if path == '/ocs/v1.php/cloud/capabilities':
+            return self.ocs({'capabilities': {'spreed': {'features': TALK_FEATURES}}})
+
+        if path == f'/ocs/v1.php/cloud/users/{self.user}':
+            return self.ocs({'id': self.user, 'displayname': 'Benchmark User'})
+
+        if path == '/ocs/v2.php/apps/spreed/api/v4/room':
+            modified_since = int(params.get('modifiedSince', 0))
+            return self.ocs(
+                [room.as_conversation() for room in self.rooms.values()
+                 if room.modified >= modified_since],
+                headers={'X-Nextcloud-Talk-Modified-Before': str(int(time.time()))})
+
+        if re.fullmatch(r'/ocs/v2.php/apps/spreed/api/v4/room/\w+/participants', path):
+            return self.ocs([
+                {'actorType': 'users', 'actorId': f'user{i}', 'displayName': f'User {i}'}
+                for i in range(7)])
+
+        if path == '/ocs/v2.php/apps/user_status/api/v1/statuses':
+            return self.ocs([self.status(f'user{i}') for i in range(7)][
+                int(params.get('offset', 0)):][:int(params.get('limit', 100))])
+
+        if match := re.fullmatch(r'/ocs/v2.php/apps/user_status/api/v1/statuses/(\w+)', path):
+            return self.ocs(self.status(match.group(1)))
+
+        if match := re.fullmatch(r'/ocs/v2.php/apps/spreed/api/v1/chat/(\w+)', path):
+            room = self.rooms.get(match.group(1))
+            if room is None:
+                return httpx.Response(404)
+            if request.method == 'POST':
+                data = dict(urllib.parse.parse_qsl(request.content.decode()))
+                msg = self.post(
+                    room, message=data.get('message', ''),
+                    reference_id=data.get('referenceId'), track=False)
+                return self.ocs(msg, status=201)
+            return await self.chat(room, params)
+
+        return httpx.Response(404)
+
+    def status(self, user: str) -> Dict[str, Any]:
+        statuses = ('online', 'away', 'dnd', 'offline')
+        return {'userId': user, 'status': statuses[sum(map(ord, user)) % len(statuses)]}
+
+    async def chat(self, room: FakeRoom, params: Dict[str, str]) -> httpx.Response:
+        # The client sends limit=0 for the server's default
+        limit = min(int(params.get('limit', 0)) or 100, 200)
+        last_known = int(params.get('lastKnownMessageId', 0))
+
+        if params.get('lookIntoFuture') == '1':
+            newer = [m for m in room.messages if m['id'] > last_known]
+            timeout = min(int(params.get('timeout', 30)), 60)
+            if not newer and timeout:
+                try:
+                    await asyncio.wait_for(room.changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                newer = [m for m in room.messages if m['id'] > last_known]
+            messages = newer[:limit]
+        else:
+            older = [m for m in room.messages if not last_known or m['id'] < last_known]
+            messages = list(reversed(older[-limit:]))
+
+        if not messages:
+            return httpx.Response(304)
+        return self.ocs(messages, headers={'X-Chat-Last-Given': str(messages[-1]['id'])})
+
+    def ocs(
+            self,
+            data: Any,
+            status: int = 200,
+            headers: Dict[str, str] = {}) -> httpx.Response:
+        content = json.dumps({
+            'ocs': {'meta': {'status': 'ok', 'statuscode': status, 'message': 'OK'},
+                    'data': data}})
+        return self.respond(httpx.Response(status, content=content, headers=headers))
+
+    def respond(self, response: httpx.Response) -> httpx.Response:
+        self.bytes_served += len(response.content)
+        return response
@@ -0,0 +1,340 @@
+"""Run the client against FakeTalkServer and report how it scales.
+
+The full application is started with its real widgets, so a display is
+needed; on a headless machine run it under Xvfb:
+
+    $ xvfb-run python -m benchmarks.run --rooms 50 --rate 100 --output after.json
+    $ python -m benchmarks.run --compare before.json after.json
+
+Configuration, message history, caches and logs go to a temporary directory,
+so the user's own settings and caches neither affect nor are touched by a run.
+Traffic is generated from a fixed seed, so results from different commits
+with the same arguments are directly comparable.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from typing import Any, Dict, List, Optional
+
+
+def isolate(directory: str, log_level: str):
+    """Point every per-user directory the client uses at `directory`."""
+    for name in ('XDG_CONFIG_HOME', 'XDG_DATA_HOME', 'XDG_CACHE_HOME', 'XDG_STATE_HOME'):
+        os.environ[name] = os.path.join(directory, name.lower())
+
+    config_path = os.path.join(os.environ['XDG_CONFIG_HOME'], 'nctalk')
+    os.makedirs(config_path)
+    with open(os.path.join(config_path, 'configuration.json'), 'w') as fp:
+        json.dump({'log_level': log_level}, fp)
+
+
+def rss_bytes() -> int:
+    """Return the current resident set size of this process."""
+    try:
+        with open('/proc/self/statm') as fp:
+            return int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # No /proc; fall back to the peak, in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    if not samples:
+        return {'count': 0, 'mean': None, 'p50': None, 'p95': None, 'max': None}
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'mean': statistics.fmean(ordered),
+        'p50': ordered[len(ordered) // 2],
+        'p95': ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)],
+        'max': ordered[-1],
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Benchmark:
+    """Drive one NCTalkApp against a FakeTalkServer and collect measurements.
+
+    The run logs in, waits until every room has loaded its history, opens the
+    first room, then has the server post messages for `duration` seconds.
+    Afterwards it waits up to `drain` seconds for the remaining messages to
+    reach the screen, since rooms in the background are only polled every so
+    often.
+    """
+
+    # Seconds between event-loop lag samples
+    probe_interval = 0.05
+
+    def __init__(self, args: argparse.Namespace):
+        # Imported here, after isolate() has redirected the user directories
+        import httpx
+
+        from nctalk_client import app
+        from nctalk_client.instrumentation import InstrumentedNextCloud
+        from nctalk_client.rooms import Room
+
+        from .fake_talk import FakeTalkServer
+
+        self.args = args
+        self.server = FakeTalkServer(
+            rooms=args.rooms,
+            rate=args.rate,
+            attachment_ratio=args.attachment_ratio,
+            attachment_size=args.attachment_size,
+            history=args.history,
+            seed=args.seed)
+
+        self.nca = InstrumentedNextCloud(
+            client=httpx.AsyncClient(transport=self.server.transport()),
+            user=self.server.user,
+            password='benchmark',
+            endpoint=self.server.endpoint)
+
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.app = app.NCTalkApp(self.loop, tk_integration=args.tk_integration)
+
+        # (seconds from post to insertion, room was focused) per generated message
+        self.latencies: List[tuple] = []
+        self.last_render = 0.0
+        self.loop_lag: List[float] = []
+        self.rss: List[int] = []
+        self.results: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.__hook_rendering(Room)
+
+    def __hook_rendering(self, room_class):
+        """Time every generated message from the server posting it to its insertion."""
+        insert_messages = room_class.insert_messages
+
+        def timed_insert_messages(room, *args, **kwargs):
+            rendered = insert_messages(room, *args, **kwargs)
+            now = time.monotonic()
+            for msg_id, *_ in rendered:
+                if created := self.server.created.get(msg_id):
+                    self.latencies.append(
+                        (now - created, room is self.app.scheduler.focused))
+                    self.last_render = now
+            return rendered
+
+        room_class.insert_messages = timed_insert_messages
+
+    def run(self) -> Dict[str, Any]:
+        self.app.start_app()
+        self.loop.create_task(self.measure())
+        self.loop.run_forever()
+        self.loop.close()
+        return self.results
+
+    async def log_in(self):
+        login = self.app.login_window
+        login.nca = self.nca
+        login.user = await self.nca.get_user()
+        login.logged_in = True
+        login.window.destroy()
+
+    async def rooms_ready(self):
+        while len(self.app.rooms) < self.args.rooms or \
+                not all(room.ready.is_set() for room in self.app.rooms):
+            await asyncio.sleep(self.probe_interval)
+
+    async def probe(self):
+        """Sample event-loop lag and memory use until cancelled."""
+        next_rss = 0
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.probe_interval)
+            now = time.monotonic()
+            self.loop_lag.append(now - started - self.probe_interval)
+            if now >= next_rss:
+                self.rss.append(rss_bytes())
+                next_rss = now + 1
+
+    async def measure(self):
+        try:
+            await self.__measure()
+        except asyncio.TimeoutError:
+            self.error = f'Rooms did not finish loading in {self.args.startup_timeout}s'
+        finally:
+            self.app.close()
+
+    async def __measure(self):
+        started = time.monotonic()
+        await self.log_in()
+        await asyncio.wait_for(self.rooms_ready(), self.args.startup_timeout)
+        startup = time.monotonic() - started
+
+        # Look at the first room, as a user would.
+        self.app.room_tabs.select(next(iter(self.app.rooms)).widget)
+
+        calls_before = {
+            name: endpoint.calls for name, endpoint in self.nca.stats.by_endpoint.items()}
+        bytes_before = self.server.bytes_served
+        probe = self.loop.create_task(self.probe())
+
+        generate_started = time.monotonic()
+        await self.server.generate(self.args.duration)
+
+        drain_deadline = time.monotonic() + self.args.drain
+        while len(self.latencies) < len(self.server.created) and \
+                time.monotonic() < drain_deadline:
+            await asyncio.sleep(self.probe_interval)
+        elapsed = time.monotonic() - generate_started
+        probe.cancel()
+
+        by_endpoint = {
+            name: endpoint.calls - calls_before.get(name, 0)
+            for name, endpoint in self.nca.stats.by_endpoint.items()}
+        requests = sum(by_endpoint.values())
+        rendered = len(self.latencies)
+        ingest_time = (self.last_render or time.monotonic()) - generate_started
+
+        self.results = {
+            'benchmark': {
+                key: getattr(self.args, key) for key in (
+                    'rooms', 'rate', 'duration', 'drain', 'history', 'attachment_ratio',
+                    'attachment_size', 'seed', 'tk_integration')},
+            'environment': {
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'time': time.time(),
+            },
+            'results': {
+                'startup_seconds': startup,
+                'messages_posted': len(self.server.created),
+                'messages_rendered': rendered,
+                'ingest_messages_per_second': rendered / ingest_time if ingest_time else 0,
+                'render_latency': percentiles([lat for lat, _ in self.latencies]),
+                'render_latency_focused': percentiles(
+                    [lat for lat, focused in self.latencies if focused]),
+                'render_latency_background': percentiles(
+                    [lat for lat, focused in self.latencies if not focused]),
+                'requests': requests,
+                'requests_per_second': requests / elapsed,
+                'requests_by_endpoint': by_endpoint,
+                'bytes_served_per_second': (self.server.bytes_served - bytes_before) / elapsed,
+                'event_loop_lag': percentiles(self.loop_lag),
+                'rss_peak_bytes': max(self.rss, default=rss_bytes()),
+                'rss_final_bytes': rss_bytes(),
+            },
+        }
+
+
+def flatten(results: Dict[str, Any], prefix: str = '') -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+
+def compare(before_file: str, after_file: str):
+    """Print every measurement of two result files side by side."""
+    with open(before_file) as fp:
+        before = json.load(fp)
+    with open(after_file) as fp:
+        after = json.load(fp)
+
+    if before['benchmark'] != after['benchmark']:
+        print('Warning: the runs used different benchmark arguments', file=sys.stderr)
+
+    old, new = flatten(before['results']), flatten(after['results'])
+
+    def show(value: Optional[float]) -> str:
+        return '-' if value is None else f'{value:.6g}'
+
+    print(f'{"":48} {before["environment"]["commit"] or "before":>12} '
+          f'{after["environment"]["commit"] or "after":>12} {"change":>8}')
+    for key in sorted(old.keys() | new.keys()):
+        a, b = old.get(key), new.get(key)
+        change = f'{(b - a) / a:+.1%}' if a and b is not None else ''
+        print(f'{key:48} {show(a):>12} {show(b):>12} {change:>8}')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.run',
+        description='Benchmark the Nextcloud Talk client against a simulated server')
+    parser.add_argument('--rooms', type=int, default=10, help='Number of rooms (default: 10)')
+    parser.add_argument(
+        '--rate', type=float, default=20,
+        help='Messages per second posted across all rooms (default: 20)')
+    parser.add_argument(
+        '--duration', type=float, default=30,
+        help='Seconds to post messages for (default: 30)')
+    parser.add_argument(
+        '--drain', type=float, default=40,
+        help='Seconds to wait afterwards for messages to be displayed (default: 40)')
+    parser.add_argument(
+        '--history', type=int, default=200,
+        help='Messages already in each room (default: 200)')
+    parser.add_argument(
+        '--attachment-ratio', type=float, default=0.05,
+        help='Fraction of messages that are image attachments (default: 0.05)')
+    parser.add_argument(
+        '--attachment-size', type=int, default=512,
+        help='Width and height of attachment images in pixels (default: 512)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument(
+        '--tk-integration', choices=['event', 'poll'], default='event',
+        help='How Tk events are driven from asyncio (default: event)')
+    parser.add_argument(
+        '--startup-timeout', type=float, default=120,
+        help='Seconds to wait for every room to load (default: 120)')
+    parser.add_argument(
+        '--log-level', default='WARNING', help='Client log level (default: WARNING)')
+    parser.add_argument('--output', metavar='FILE', help='Write results to FILE as JSON')
+    parser.add_argument(
+        '--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+        help='Compare two result files instead of running')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if sys.platform.startswith('linux') and not os.environ.get('DISPLAY'):
+        sys.exit('No display available; run the benchmark under xvfb-run.')
+
+    with tempfile.TemporaryDirectory(prefix='nctalk-benchmark-') as directory:
+        isolate(directory, args.log_level)
+        benchmark = Benchmark(args)
+        results = benchmark.run()
+    if benchmark.error:
+        sys.exit(benchmark.error)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            fp.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,89 @@
 """Run the Jewels."""
 
-from . import app
+from .startup import StartupTimer
+import argparse
 import asyncio
+import os
+import sys
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='nctalk', description='Nextcloud Talk Client')
+    parser.add_argument(
+        '--tk-integration', choices=['event', 'poll'], default=None,
+        help='How Tk events are driven from asyncio (default: from configuration, '
+             'or "event")')
+    parser.add_argument(
+        '--measure-idle-cpu', type=float, default=0, metavar='SECONDS',
+        help='Log CPU usage and Tk wakeups measured over SECONDS')
+    parser.add_argument(
+        '--startup-report', action='store_true',
+        help='Log how long each phase of startup took')
+
+    headless = parser.add_argument_group(
+        'headless mode',
+        'Stream new messages from every room as JSON lines, without the GUI.  The '
+        'password, preferably an app password, is read from $NCTALK_PASSWORD.')
+    headless.add_argument(
+        '--headless', action='store_true', help='Run without the GUI')
+    headless.add_argument(
+        '--endpoint', help='Nextcloud URL (default: from configuration)')
+    headless.add_argument('--user', help='User name (default: from configuration)')
+    headless.add_argument(
+        '--output', metavar='FILE',
+        help='Append messages to FILE instead of writing them to stdout')
+    headless.add_argument(
+        '--state', metavar='FILE',
+        help='Remember the last message written for each room in FILE, and '
+             'carry on from there next time')
+    headless.add_argument(
+        '--history', type=int, default=0, metavar='N',
+        help='Also write the N newest messages of rooms not yet in the state file')
+    return parser.parse_args()
+
+
+def run_headless(args: argparse.Namespace):
+    from .config import NCTalkConfiguration
+    from .headless import HeadlessClient
+
+    app_config = NCTalkConfiguration()
+    endpoint = args.endpoint or app_config.get('endpoint', '')
+    user = args.user or app_config.get('user', '')
+    password = os.environ.get('NCTALK_PASSWORD')
+    if not (endpoint and user and password):
+        sys.exit('Headless mode needs --endpoint, --user and $NCTALK_PASSWORD')
+
+    output = open(args.output, 'a') if args.output else sys.stdout
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    client = HeadlessClient(
+        loop, output, endpoint, user, password, state_file=args.state, history=args.history)
+    client.start()
+    loop.run_forever()
+
+    # Let the cancelled tasks finish
+    loop.run_until_complete(asyncio.sleep(0))
+    loop.close()
+    if args.output:
+        output.close()
+    sys.exit(client.exit_status)
 
 
 def run():
+    args = parse_args()
+    if args.headless:
+        run_headless(args)
+
+    # Imported here so --help and bad arguments don't pay for the GUI.
+    from . import app
+    StartupTimer.mark('imports')
+
     loop = asyncio.get_event_loop()
-    myapp = app.NCTalkApp(loop)
+    myapp = app.NCTalkApp(
+        loop,
+        tk_integration=args.tk_integration,
+        measure_idle_cpu=args.measure_idle_cpu,
+        startup_report=args.startup_report)
     asyncio.run(myapp.run())
 
     # Have to stop/run_forever to clean up canceled threads.
@@ -1,19 +1,32 @@
 """Nextcloud Talk Client."""
 
 import asyncio
-import pygubu
+import logging
 
 from tkinter import ttk, font as tkfont
 
+from typing import Any, TYPE_CHECKING
+
 from nextcloud_async import NextCloudAsync
 
+from .applog import AppLogger
 from .config import NCTalkConfiguration
+from .health import ServerHealth
 from .logs import Logger
+from .registry import RoomRegistry
 from .login import LoginWindow
-from .rooms import Room
+from .scheduler import PollScheduler
+from .startup import StartupTimer
+from .sync import RoomList
 from .task_manager import TaskManager
-from .preferences import PreferencesWindow
-from .constants import PROJECT_PATH, PROJECT_UI, UPDATE_INTERVAL
+from .ui import ui_builder
+from .updater import TkUpdater
+from .constants import (
+    ICON_SIZE,
+    LONG_POLL_TIMEOUT, BACKGROUND_POLL_INTERVAL, BACKGROUND_POLL_RATE, ATTACHMENT_WORKERS,
+    IMAGE_CACHE_BYTES, IMAGE_CACHE_MAX_AGE, CHAT_HISTORY_LINES, ROOM_LIST_INTERVAL,
+    ROOM_LIST_FULL_REFRESH, STATUS_TTL, HEALTH_FAILURE_THRESHOLD, HEALTH_BACKOFF,
+    HEALTH_BACKOFF_MAX, ATTACHMENT_MAX_BYTES)
 
 try:
     import ttkthemes
@@ -22,34 +35,61 @@ except ModuleNotFoundError:
 else:
     HAS_TTKTHEMES = True
 
+if TYPE_CHECKING:
+    from .rooms import Room
+
+
+def import_session_modules():
+    """Import the modules that are only needed once logged in.
+
+    This runs in a thread while the login window is up, so the imports are
+    done by the time the user has logged in.
+    """
+    from . import attachments, icons, images, presence, rooms, store  # noqa: F401
+
 
 class NCTalkApp():
 
     nca: NextCloudAsync = None
     logger: Logger = None
 
-    def __init__(self, loop: asyncio.BaseEventLoop, master=None):
+    def __init__(
+            self,
+            loop: asyncio.BaseEventLoop,
+            master=None,
+            tk_integration: str = None,
+            measure_idle_cpu: float = 0,
+            startup_report: bool = False):
 
-        self.rooms = []
+        self.rooms = RoomRegistry()
         self.loop = TaskManager(loop)
 
         self.master = master
         self.app_config = NCTalkConfiguration()
         self.nca = None
-        self.tasks = [
-            self.loop.create_task(self.updater())]
+        self.store = None
+        self.health = None
+        self.room_list = None
+        self.tasks = []
+
+        self.tk_integration = tk_integration or self.app_config.get('tk_integration', 'event')
+        self.measure_idle_cpu = measure_idle_cpu
+        self.startup_report = startup_report
 
     async def run(self):
         self.start_app()
 
     def start_app(self):
-        self.builder = builder = pygubu.Builder()
-        builder.add_resource_path(PROJECT_PATH)
-        builder.add_from_file(PROJECT_UI / 'app.ui')
+        self.builder = builder = ui_builder('app.ui')
 
         # Load the main app window
         self.window = self.builder.get_object('main_window', self.master)
         builder.connect_callbacks(self)
+        StartupTimer.mark('main window')
+
+        # Drive Tk from the asyncio loop
+        self.updater = TkUpdater(self.window, mode=self.tk_integration)
+        self.tasks.append(self.updater.start(self.loop))
 
         # Set up theme
         if HAS_TTKTHEMES:
@@ -62,13 +102,35 @@ class NCTalkApp():
         self.style.theme_use(user_selected_theme)
 
         self.font = tkfont.nametofont('TkDefaultFont')
-        self.font.configure(size=self.app_config.get('font_size', '11'))
+        self.font.configure(size=self.app_config.get('font_size', 11))
+        if font_family := self.app_config.get('font_family', ''):
+            self.font.configure(family=font_family)
+        StartupTimer.mark('theme')
+
+        # Apply appearance changes from the preferences right away
+        self.app_config.subscribe(
+            self.setting_changed, 'theme', 'font_family', 'font_size', 'icon_size')
 
         # Prepare the logging subsystem
         self.applog = self.builder.get_object('applog', self.master)
-        self.logger = Logger(self.applog)
+        self.logger = AppLogger(
+            self.applog,
+            level=self.app_config.log_level())
         self.tasks.append(
-            self.loop.create_task(self.logger.process_queue()))
+            self.loop.supervise(self.logger.process_queue, name='logger'))
+
+        if self.app_config.invalid:
+            self.loop.create_task(self.report_invalid_settings())
+        if self.measure_idle_cpu:
+            self.loop.create_task(self.report_idle_cpu(self.measure_idle_cpu))
+
+        # One scheduler polls every room for new messages
+        self.scheduler = PollScheduler(
+            self.loop,
+            self.logger,
+            long_poll_timeout=self.app_config.get('long_poll_timeout', LONG_POLL_TIMEOUT),
+            interval=self.app_config.get('poll_interval', BACKGROUND_POLL_INTERVAL),
+            rate=self.app_config.get('poll_rate', BACKGROUND_POLL_RATE))
 
         # Catch window manager close event
         self.window.protocol('WM_DELETE_WINDOW', self.close)
@@ -79,16 +141,44 @@ class NCTalkApp():
 
         # Present login window
         self.login_window = LoginWindow(self.loop, self.logger)
+        StartupTimer.mark('login window')
+
+        # Import the rest while the user logs in
+        self.session_modules = self.loop.event_loop.run_in_executor(
+            None, import_session_modules)
 
         # Save auth task for removal later
         self.auth_task = self.loop.create_task(self.wait_for_auth())
         self.tasks.append(self.auth_task)
 
-    async def updater(self):
-        """Iterate over the asyncio event loop."""
-        while True:
-            self.window.update()
-            await asyncio.sleep(UPDATE_INTERVAL)
+    async def report_invalid_settings(self):
+        for key, value in self.app_config.invalid.items():
+            await self.logger(f'Ignoring invalid setting {key}={value!r}', logging.WARNING)
+
+    def setting_changed(self, key: str, value: Any):
+        match key:
+            case 'theme':
+                self.style.theme_use(value)
+            case 'font_family':
+                self.font.configure(family=value)
+            case 'font_size':
+                self.font.configure(size=value)
+            case 'icon_size' if self.nca:
+                from .icons import Icons
+
+                Icons.preload(value)
+                for room in self.rooms:
+                    self.loop.create_task(room.redraw_status())
+
+    async def report_idle_cpu(self, duration: float):
+        """Log CPU usage and Tk wakeups measured over `duration` seconds."""
+        await self.logger(
+            f'Measuring idle CPU for {duration}s ({self.tk_integration} mode)...')
+        stats = await self.updater.measure_idle_cpu(duration)
+        await self.logger(
+            f'Idle CPU ({self.tk_integration} mode): {stats["cpu_percent"]:.2f}%, '
+            f'{stats["wakeups_per_second"]:.1f} wakeups/s, '
+            f'{stats["events_per_second"]:.1f} Tk events/s')
 
     async def wait_for_auth(self):
         """Wait for LoginWindow() to populate the NextCloudTalk client."""
@@ -102,40 +192,134 @@ class NCTalkApp():
             # Upon login, remove the wait_for_auth task from the event loop, pull
             # the NextCloudAsync client from login_window, and free up the memory
             # used by login_window.
+            StartupTimer.mark('waiting for login')
             self.tasks.remove(self.auth_task)
             self.nca = self.login_window.nca
             self.user = self.login_window.user
             self.login_window = None
+
+            await self.session_modules
+            from .attachments import AttachmentPool
+            from .icons import Icons
+            from .images import Image
+            from .presence import StatusTracker
+            from .rooms import Room
+            from .store import MessageStore
+            StartupTimer.mark('session modules')
+
+            Room.max_lines = self.app_config.get('chat_history_lines', CHAT_HISTORY_LINES)
+
+            # Decode icons once, at the configured size
+            Icons.preload(self.app_config.get('icon_size', ICON_SIZE))
+            StartupTimer.mark('icons')
+
+            self.store = MessageStore(self.nca.endpoint, self.nca.user)
+            Image.open_disk_cache(
+                max_bytes=self.app_config.get('image_cache_bytes', IMAGE_CACHE_BYTES),
+                max_age=self.app_config.get('image_cache_max_age', IMAGE_CACHE_MAX_AGE))
+            self.attachments = AttachmentPool(
+                self.nca,
+                self.loop,
+                self.logger,
+                workers=self.app_config.get('attachment_workers', ATTACHMENT_WORKERS),
+                max_bytes=self.app_config.get('attachment_max_bytes', ATTACHMENT_MAX_BYTES))
+            self.statuses = StatusTracker(
+                self.nca,
+                self.loop,
+                self.logger,
+                ttl=self.app_config.get('status_ttl', STATUS_TTL))
+            self.health = ServerHealth(
+                self.nca,
+                self.loop,
+                self.logger,
+                threshold=self.app_config.get(
+                    'health_failure_threshold', HEALTH_FAILURE_THRESHOLD),
+                backoff=self.app_config.get('health_backoff', HEALTH_BACKOFF),
+                backoff_max=self.app_config.get('health_backoff_max', HEALTH_BACKOFF_MAX))
+            self.health.subscribe(self.server_health_changed)
+            self.room_list = RoomList(
+                self.nca, self.logger, self.rooms, self.health,
+                self.new_room, self.retire_room)
+            StartupTimer.mark('caches')
             await self.initialize_rooms()
 
     async def initialize_rooms(self):
-        """Open tabs for each room and initialize Room objects."""
+        """Open tabs for each room and initialize Room objects.
+
+        Each Room fetches its history in its own task as soon as it is
+        created, so all rooms load in parallel while the tabs are built.
+        """
         await self.logger('Fetching active rooms...')
         rooms = await self.nca.get_conversations()
+        StartupTimer.mark('room list')
 
+        await self.logger(f'Joining {len(rooms)} rooms')
         for c in rooms:
-            await self.logger(f'Joining room "{c["displayName"]}"')
-            self.loop.create_task(self.new_room(c))
+            await self.new_room(c)
+            # Let the window and the first rooms' requests run between tabs.
+            await asyncio.sleep(0)
+        StartupTimer.mark('room tabs')
+
+        self.scheduler.start(self.health)
+        self.tasks.append(self.loop.supervise(
+            lambda: self.room_list.refresh_loop(
+                interval=self.app_config.get('room_list_interval', ROOM_LIST_INTERVAL),
+                full_every=self.app_config.get(
+                    'room_list_full_refresh', ROOM_LIST_FULL_REFRESH)),
+            name='room-list'))
+        self.loop.create_task(self.report_startup())
+
+    async def report_startup(self):
+        """Log how long each startup phase took, once every room has loaded."""
+        await asyncio.gather(*(room.ready.wait() for room in self.rooms))
+        StartupTimer.mark('room history')
+        await self.logger(
+            StartupTimer.report(), logging.INFO if self.startup_report else logging.DEBUG)
 
     async def new_room(self, data):
-        room = Room(self.nca, self.loop, self.logger, self.room_tabs, self.user, data)
-        self.rooms.append(room)
+        from .rooms import Room
+
+        room = Room(
+            self.nca, self.loop, self.logger, self.room_tabs, self.user, data,
+            self.attachments, self.store, self.statuses, self.scheduler)
+        self.rooms.add(room)
+        self.scheduler.add(room)
         self.room_tabs.add(room.widget, text=room.displayName, state='disabled')
 
+    def retire_room(self, room: 'Room'):
+        self.scheduler.remove(room)
+        room.close_tab()
+        self.rooms.remove(room)
+
     def room_tab_changed(self, e):
-        current_tab_id = self.room_tabs.index('current')
-        current_tab_name = self.room_tabs.tab(current_tab_id, 'text')
+        current_room = self.rooms.for_tab(self.room_tabs.select())
+        if current_room:
+            asyncio.gather(current_room.update_participants())
 
-        for x in self.rooms:
-            if x.displayName == current_tab_name:
-                x.update_interval = 5
-                asyncio.gather(x.update_participants())
-            else:
-                x.update_interval = 30
+        self.scheduler.focus(current_room)
 
     def edit_preferences(self):
+        from .preferences import PreferencesWindow
+
         self.preferences_window = PreferencesWindow(self.style, self.font)
 
+    def show_diagnostics(self):
+        from .diagnostics import DiagnosticsWindow
+
+        stats = self.nca.stats if self.nca else None
+        self.diagnostics_window = DiagnosticsWindow(stats, self.loop, self.rooms)
+
     def close(self, _: None = None):
+        self.app_config.flush()
+        self.scheduler.shutdown()
+        if self.health:
+            self.health.shutdown()
+        self.updater.stop()
+        if self.store:
+            from .images import Image
+
+            Image.disk_cache.save()
+            self.store.close()
+        self.logger.shutdown()
         self.loop.shutdown()
         self.window.destroy()
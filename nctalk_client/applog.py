@@ -0,0 +1,71 @@
+import asyncio
+import collections
+import logging
+
+import datetime as dt
+import tkinter as tk
+
+from .constants import LOG_FLUSH_INTERVAL, LOG_MAX_LINES
+from .logs import Logger
+from .updater import TkUpdater
+
+
+class AppLogger(Logger):
+    """Application log, also shown in the log window.
+
+    Lines for the window are buffered and written in batches, at most once
+    every LOG_FLUSH_INTERVAL seconds; the widget keeps only the newest
+    LOG_MAX_LINES lines.
+    """
+
+    def __init__(self, log_widget, level: int = logging.INFO):
+        super().__init__(level)
+        self.log_widget = log_widget
+
+        self.pending = collections.deque(maxlen=LOG_MAX_LINES)
+        self.ready = asyncio.Event()
+        self.widget_lines = 0
+
+        for name, color in (('WARNING', 'dark orange'), ('ERROR', 'red')):
+            self.log_widget.tag_configure(name, foreground=color)
+
+    async def log(self, text: str, level: int = logging.INFO):
+        """Write a message to the application log window and console."""
+        if level < self.level:
+            return
+
+        self.sink.log(level, text)
+
+        now = dt.datetime.now().strftime(r'%Y/%m/%d %H:%M:%S')
+        self.pending.append((f'{now} - {text}\n', logging.getLevelName(level)))
+        self.ready.set()
+
+    async def process_queue(self):
+        """Flush buffered lines to the log widget in batches."""
+        while True:
+            await self.ready.wait()
+            await asyncio.sleep(LOG_FLUSH_INTERVAL)
+            self.ready.clear()
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        # Text.insert() takes alternating text and tag arguments
+        chunks = []
+        while self.pending:
+            line, level = self.pending.popleft()
+            chunks.extend((line, level))
+            self.widget_lines += line.count('\n')
+
+        self.log_widget.config(state='normal')
+        self.log_widget.insert(tk.END, *chunks)
+
+        excess = self.widget_lines - LOG_MAX_LINES
+        if excess > 0:
+            self.log_widget.delete('1.0', f'{excess + 1}.0')
+            self.widget_lines -= excess
+        self.log_widget.config(state='disabled')
+        self.log_widget.see(tk.END)
+        TkUpdater.wake()
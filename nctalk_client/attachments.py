@@ -0,0 +1,128 @@
+"""Download chat attachments in the background."""
+
+import asyncio
+import logging
+import random
+
+import httpx
+
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from nextcloud_async import NextCloudAsync
+from nextcloud_async.exceptions import (
+    NextCloudException, NextCloudNotFound, NextCloudRequestTimeout, NextCloudTooManyRequests)
+
+from .constants import (
+    ATTACHMENT_WORKERS, ATTACHMENT_RETRIES, ATTACHMENT_BACKOFF, ATTACHMENT_MAX_BYTES)
+from .images import Image, Progress
+from .logs import Logger
+from .task_manager import TaskManager
+
+RETRYABLE = (httpx.TransportError, NextCloudRequestTimeout, NextCloudTooManyRequests)
+
+
+class AttachmentPool:
+    """Download attachments for every room with a bounded number of workers.
+
+    Rooms submit the `file` parameter of an attachment message together with
+    a callback and move on; the callback is awaited with the downloaded
+    Image, or with None if every attempt failed.
+
+    Given a height, the server's preview of that height is downloaded
+    instead of the original, falling back to the original for files the
+    server has no preview of.  Downloads are streamed to disk, and those
+    larger than `max_bytes` are abandoned.
+    """
+
+    def __init__(
+            self,
+            nca: NextCloudAsync,
+            loop: TaskManager,
+            logger: Logger,
+            workers: int = ATTACHMENT_WORKERS,
+            retries: int = ATTACHMENT_RETRIES,
+            backoff: float = ATTACHMENT_BACKOFF,
+            max_bytes: int = ATTACHMENT_MAX_BYTES):
+
+        self.nca = nca
+        self.loop = loop
+        self.logger = logger
+        self.retries = retries
+        self.backoff = backoff
+        self.max_bytes = max_bytes
+
+        self.queue = asyncio.Queue()
+        self.workers = [
+            self.loop.supervise(self.worker, name=f'attachment-worker-{i}')
+            for i in range(workers)]
+
+    def submit(
+            self,
+            file: Dict[str, Any],
+            callback: Callable[[Optional[Image]], Awaitable[None]],
+            height: int = 0,
+            progress: Optional[Progress] = None):
+        """Queue `file` for download, as a preview `height` high if given.
+
+        `progress` is called as the download comes in.
+        """
+        self.queue.put_nowait((file, height, callback, progress))
+
+    async def worker(self):
+        while True:
+            file, height, callback, progress = await self.queue.get()
+            try:
+                image = await self.fetch(file, height, progress)
+                await callback(image)
+            except Exception as e:
+                # A file that cannot be decoded, or that left the cache before
+                # it was, must not take the worker and the queue down with it.
+                await self.logger(
+                    f'Unable to show attachment {file.get("path")}: {e!r}', logging.WARNING)
+                try:
+                    await callback(None)
+                except Exception as e:
+                    await self.logger(
+                        f'Unable to mark attachment {file.get("path")} unavailable: {e!r}',
+                        logging.ERROR)
+
+    async def fetch(
+            self,
+            file: Dict[str, Any],
+            height: int = 0,
+            progress: Optional[Progress] = None) -> Optional[Image]:
+        """Download `file` into the image cache, retrying with backoff."""
+        img = Image()
+        for attempt in range(self.retries + 1):
+            try:
+                await self.download(img, file, height, progress)
+            except (httpx.HTTPError, NextCloudException) as e:
+                if not isinstance(e, RETRYABLE) or attempt == self.retries:
+                    await self.logger(
+                        f'Giving up on attachment {file["path"]}: {e!r}', logging.WARNING)
+                    return None
+                delay = self.backoff * 2 ** attempt
+                await asyncio.sleep(delay + random.random() * delay)
+            else:
+                return img
+
+    async def download(
+            self,
+            img: Image,
+            file: Dict[str, Any],
+            height: int,
+            progress: Optional[Progress]):
+        if height and file.get('preview-available', 'yes') == 'yes':
+            try:
+                await img.from_preview(
+                    self.nca, file['id'], height, max_bytes=self.max_bytes, progress=progress)
+                return
+            except NextCloudNotFound:
+                await self.logger(f'No preview of {file["path"]}', logging.DEBUG)
+        await img.from_file(
+            self.nca, file['path'], max_bytes=self.max_bytes, progress=progress)
+
+    def shutdown(self):
+        for task in self.workers:
+            self.loop.remove(task)
+        self.workers = []
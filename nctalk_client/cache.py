@@ -0,0 +1,183 @@
+"""Size-bounded disk cache for attachments."""
+
+import json
+import os
+import stat
+import threading
+import time
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+from .constants import IMAGE_CACHE_BYTES, IMAGE_CACHE_MAX_AGE, IMAGE_CACHE_SAVE_DELAY
+
+
+class DiskCache:
+    """Track cached files in an index so lookups never touch the disk.
+
+    Files live in directories sharded on the first twelve characters of their
+    key.  The index maps each key to its size and last access time, ordered
+    from least to most recently used, and is saved as `index.json` next to the
+    files.  When the cache grows past `max_bytes`, entries older than
+    `max_age` seconds go first, then resized variants (keys containing an
+    underscore), then originals, least recently used first, sparing the file
+    just added.  Changes are saved IMAGE_CACHE_SAVE_DELAY seconds later from a
+    timer thread, so a burst of downloads writes the index once; save() writes
+    it right away, as on exit.
+
+    Lookups may come from executor threads, so the index is guarded by a lock.
+    """
+
+    def __init__(
+            self,
+            cache_path: Path,
+            max_bytes: int = IMAGE_CACHE_BYTES,
+            max_age: float = IMAGE_CACHE_MAX_AGE):
+
+        self.cache_path = cache_path
+        self.index_file = cache_path / 'index.json'
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        self.index: OrderedDict = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        # Saves the index once changes have settled
+        self.save_timer: Optional[threading.Timer] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.cache_path.mkdir(parents=True, exist_ok=True, mode=stat.S_IRWXU)
+        self.load_index()
+
+    def path(self, key: str) -> Path:
+        hash_dirs = '/'.join(key[x:x+2] for x in range(0, 12, 2))
+        return self.cache_path / hash_dirs / key
+
+    def mkdir(self, key: str):
+        self.path(key).parent.mkdir(parents=True, exist_ok=True, mode=stat.S_IRWXU)
+
+    def get(self, key: str) -> bool:
+        """Return whether `key` is cached, marking it as recently used."""
+        with self.lock:
+            if key in self.index:
+                size, _ = self.index.pop(key)
+                self.index[key] = (size, time.time())
+                self.hits += 1
+                return True
+            else:
+                self.misses += 1
+                return False
+
+    def put(self, key: str, size: int):
+        """Record a file just written to path(key), then evict if over budget."""
+        with self.lock:
+            if key in self.index:
+                self.size -= self.index.pop(key)[0]
+            self.index[key] = (size, time.time())
+            self.size += size
+            # The caller is about to use the file, even if it alone is over budget.
+            self.__evict(keep=key)
+            self.__schedule_save()
+
+    def discard(self, key: str):
+        with self.lock:
+            self.__remove(key)
+            self.__schedule_save()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.index),
+            'bytes': self.size,
+        }
+
+    def save(self):
+        """Save the index now, rather than when the pending save is due."""
+        with self.lock:
+            if self.save_timer:
+                self.save_timer.cancel()
+                self.save_timer = None
+            self.__save_index()
+
+    def load_index(self):
+        """Load the index, rebuilding it from the files on disk if needed."""
+        try:
+            with open(self.index_file, 'r') as fp:
+                entries = json.load(fp)
+        except (FileNotFoundError, ValueError):
+            entries = self.__scan()
+
+        for key, (size, atime) in sorted(entries.items(), key=lambda x: x[1][1]):
+            self.index[key] = (size, atime)
+            self.size += size
+
+        with self.lock:
+            self.__evict()
+            self.__save_index()
+
+    def __scan(self) -> Dict[str, list]:
+        entries = {}
+        for root, _, files in os.walk(self.cache_path):
+            for name in files:
+                if name in (self.index_file.name, f'{self.index_file.stem}.tmp'):
+                    continue
+                # Left behind by a download that never finished
+                if name.endswith('.part'):
+                    try:
+                        os.remove(os.path.join(root, name))
+                    except FileNotFoundError:
+                        pass
+                    continue
+                st = os.stat(os.path.join(root, name))
+                entries[name] = [st.st_size, st.st_atime]
+        return entries
+
+    def __evict(self, keep: Optional[str] = None):
+        cutoff = time.time() - self.max_age
+        for key, (_, atime) in list(self.index.items()):
+            if atime >= cutoff:
+                break
+            self.__remove(key)
+
+        for variants_only in (True, False):
+            if self.size <= self.max_bytes:
+                return
+            for key in list(self.index):
+                if key == keep or variants_only and '_' not in key:
+                    continue
+                self.__remove(key)
+                if self.size <= self.max_bytes:
+                    return
+
+    def __remove(self, key: str):
+        if key not in self.index:
+            return
+        size, _ = self.index.pop(key)
+        self.size -= size
+        self.evictions += 1
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def __schedule_save(self):
+        # Puts come from the event loop and from executor threads alike, and
+        # the JSON work of a save stays off both.
+        if self.save_timer:
+            return
+        self.save_timer = threading.Timer(IMAGE_CACHE_SAVE_DELAY, self.save)
+        self.save_timer.daemon = True
+        self.save_timer.start()
+
+    def __save_index(self):
+        tmp_file = self.index_file.with_suffix('.tmp')
+        with open(tmp_file, 'w') as fp:
+            json.dump(self.index, fp)
+        os.replace(tmp_file, self.index_file)
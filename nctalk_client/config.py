@@ -1,39 +1,175 @@
 """Manage configuration loading/saving for nctalk app."""
 
+import asyncio
 import json
+import logging
 import stat
 import os
 
 import platformdirs as pdir
 
-from typing import Any
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+from .constants import CONFIG_SAVE_DELAY
+
+# Type of each setting.  Values are converted to it when loaded and when set,
+# so a font size written as "11" reads back as 11.  Other settings are kept as
+# they are.
+SETTING_TYPES: Dict[str, type] = {
+    'user': str,
+    'endpoint': str,
+    'theme': str,
+    'font_family': str,
+    'font_size': int,
+    'icon_size': int,
+    'log_level': str,
+    'tk_integration': str,
+    'http_version': str,
+    'http_max_connections': int,
+    'http_max_keepalive': int,
+    'http_keepalive_expiry': float,
+    'request_timeout': float,
+    'long_poll_timeout': int,
+    'poll_interval': float,
+    'poll_rate': float,
+    'room_list_interval': float,
+    'room_list_full_refresh': int,
+    'health_failure_threshold': int,
+    'health_backoff': float,
+    'health_backoff_max': float,
+    'status_ttl': float,
+    'chat_history_lines': int,
+    'attachment_workers': int,
+    'attachment_max_bytes': int,
+    'image_cache_bytes': int,
+    'image_cache_max_age': float,
+    'headless_queue_size': int,
+    'headless_state_interval': float,
+}
 
 
 class NCTalkConfiguration(dict):
+    """The settings of the whole process, kept in configuration.json.
+
+    There is only one: every NCTalkConfiguration() returns the same object,
+    which reads the file the first time.  Setting a value converts it to its
+    type in SETTING_TYPES, calls the subscribers of its key, and saves the file
+    CONFIG_SAVE_DELAY seconds later, so that a burst of changes is written
+    once.  The file is replaced atomically, and a crash while saving leaves the
+    previous version in place.
+    """
 
-    __config = {}
+    instance: Optional['NCTalkConfiguration'] = None
+
+    def __new__(cls):
+        if cls.instance is None:
+            cls.instance = super().__new__(cls)
+            cls.instance.setup()
+        return cls.instance
 
     def __init__(self):
-        super().__init__(self)
+        # Everything is set up once, by __new__().
+        pass
 
+    def setup(self):
         self.config_path = pdir.user_config_path("nctalk")
         self.config_file = f'{self.config_path}/configuration.json'
+
+        self.__config: Dict[str, Any] = {}
+        # Settings in the file that are not of their type, kept for saving
+        self.invalid: Dict[str, Any] = {}
+        # Key -> callbacks for it; callbacks under None see every key.
+        self.subscribers: Dict[Optional[str], List[Callable[[str, Any], None]]] = \
+            defaultdict(list)
+        self.save_handle: Optional[asyncio.TimerHandle] = None
+
         self.load__config()
 
     def load__config(self) -> None:
         """Load configuration from config file if one exists."""
         try:
             with open(self.config_file, "r") as fp:
-                self.__config = json.loads(fp.read())
+                config = json.loads(fp.read())
         except FileNotFoundError:
-            pass
+            return
+
+        for key, val in config.items():
+            try:
+                self.__config[key] = self.convert(key, val)
+            except ValueError:
+                self.invalid[key] = val
 
     def save_config(self) -> None:
-        """Save configuration to file."""
+        """Save configuration to file now, replacing it atomically."""
+        if self.save_handle:
+            self.save_handle.cancel()
+            self.save_handle = None
+
         self.config_path.mkdir(parents=True, exist_ok=True, mode=stat.S_IRWXU)
-        with open(self.config_file, "w") as fp:
-            fp.write(json.dumps(self.__config))
-        os.chmod(self.config_file, mode=stat.S_IRUSR | stat.S_IWUSR)
+        temp_file = f'{self.config_file}.tmp'
+        with open(temp_file, "w") as fp:
+            fp.write(json.dumps({**self.invalid, **self.__config}))
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.chmod(temp_file, mode=stat.S_IRUSR | stat.S_IWUSR)
+        os.replace(temp_file, self.config_file)
+
+    def schedule_save(self) -> None:
+        """Save configuration to file shortly, unless a save is already due."""
+        if self.save_handle:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Nothing would run a later save.
+            self.save_config()
+        else:
+            self.save_handle = loop.call_later(CONFIG_SAVE_DELAY, self.save_config)
+
+    def flush(self) -> None:
+        """Save configuration to file now if a save is due."""
+        if self.save_handle:
+            self.save_config()
+
+    @staticmethod
+    def convert(key: str, val: Any) -> Any:
+        """Return `val` as the type of setting `key`.
+
+        Raises:
+            ValueError: `val` is not of that type and does not convert to it
+
+        """
+        kind = SETTING_TYPES.get(key)
+        if kind is None or type(val) is kind:
+            return val
+        if kind is float and type(val) is int:
+            return float(val)
+        if kind is int and type(val) is float and val.is_integer():
+            return int(val)
+        if kind is not str and isinstance(val, str):
+            try:
+                return kind(val.strip())
+            except ValueError:
+                pass
+        raise ValueError(f'{key} must be {kind.__name__}, not {val!r}')
+
+    def log_level(self) -> int:
+        """Return the configured log level, or INFO if `log_level` names no level."""
+        name = self.get('log_level', 'INFO')
+        level = logging.getLevelNamesMapping().get(name.upper())
+        if level is None:
+            self.invalid['log_level'] = name
+            return logging.INFO
+        return level
+
+    def subscribe(self, callback: Callable[[str, Any], None], *keys: str) -> None:
+        """Call `callback` with the key and new value whenever one of `keys` changes.
+
+        Without `keys`, it is called for every setting.
+        """
+        for key in keys or (None,):
+            self.subscribers[key].append(callback)
 
     def __getitem__(self, key, default: Any = None) -> Any:
         return self.get(key, default)
@@ -50,4 +186,18 @@ class NCTalkConfiguration(dict):
         self.put(key, val)
 
     def put(self, key: Any, val: Any) -> None:
+        """Set `key` to `val`, notifying subscribers and saving if that changed it.
+
+        Raises:
+            ValueError: `val` does not convert to the type of `key`
+
+        """
+        val = self.convert(key, val)
+        if key in self.__config and self.__config[key] == val:
+            return
+
         self.__config[key] = val
+        self.invalid.pop(key, None)
+        for callback in (*self.subscribers.get(key, ()), *self.subscribers.get(None, ())):
+            callback(key, val)
+        self.schedule_save()
@@ -6,3 +6,115 @@ PROJECT_ICONS = PROJECT_PATH / 'assets/icons'
 
 ICON_SIZE = 16
 UPDATE_INTERVAL = 1/60
+
+# Seconds a configuration change waits to be saved along with any that follow
+CONFIG_SAVE_DELAY = 1
+
+# Seconds the server holds a long-poll open on the focused room
+LONG_POLL_TIMEOUT = 30
+# Seconds between polls of any single background room
+BACKGROUND_POLL_INTERVAL = 30
+# Maximum background polls per second, across all rooms
+BACKGROUND_POLL_RATE = 2
+# HTTP transport: protocol, connection pool size, and how many idle
+# connections are kept open and for how many seconds
+HTTP_VERSION = 'HTTP/2'
+HTTP_MAX_CONNECTIONS = 20
+HTTP_MAX_KEEPALIVE = 10
+HTTP_KEEPALIVE_EXPIRY = 60
+# Read timeout of regular requests, and how long a long-poll may outlast the
+# timeout it asked the server for
+REQUEST_TIMEOUT = 10
+LONG_POLL_MARGIN = 10
+
+# Server failures in a row before polling pauses, and the first and longest
+# delay in seconds between checks of whether the server is back
+HEALTH_FAILURE_THRESHOLD = 3
+HEALTH_BACKOFF = 2
+HEALTH_BACKOFF_MAX = 300
+
+# Seconds between room list refreshes, and refreshes between full ones that
+# also notice rooms that were left or deleted
+ROOM_LIST_INTERVAL = 30
+ROOM_LIST_FULL_REFRESH = 10
+
+# Headless mode: messages waiting to be written before polling pauses, rooms
+# fetching their initial history at once, and seconds between state saves
+HEADLESS_QUEUE_SIZE = 1000
+HEADLESS_HISTORY_FETCHES = 4
+HEADLESS_STATE_INTERVAL = 10
+
+# Longest the Tk updater sleeps while idle in 'event' mode.  Without the X
+# server connection to wake it, this is also the longest input waits after a
+# quiet spell.
+IDLE_INTERVAL = 1
+
+# Seconds a room may spend rendering one batch of messages
+RENDER_BUDGET = 0.02
+
+# Concurrent attachment downloads, shared by all rooms
+ATTACHMENT_WORKERS = 4
+# Extra attempts for a failed attachment download, and the base backoff in seconds
+ATTACHMENT_RETRIES = 3
+ATTACHMENT_BACKOFF = 1
+# Largest attachment downloaded, and the bytes read from the network at a time
+ATTACHMENT_MAX_BYTES = 50 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Extra attempts to send a chat message, and the base backoff in seconds
+SEND_RETRIES = 5
+SEND_BACKOFF = 1
+# Newest messages searched for one whose send may have reached the server
+SEND_CHECK_MESSAGES = 50
+
+# Height of images shown in the chat, fetched as server previews of that height.
+# Previews are at most PREVIEW_MAX_ASPECT times as wide as they are high.
+INLINE_IMAGE_HEIGHT = 200
+PREVIEW_MAX_ASPECT = 4
+# Share of the screen height an opened image may take up
+IMAGE_VIEWER_HEIGHT = 0.8
+
+# Pixel memory kept for recently shown attachment images
+IMAGE_MEMORY_CACHE_BYTES = 64 * 1024 * 1024
+
+# Disk space for cached attachments, and how long an unused one is kept
+IMAGE_CACHE_BYTES = 512 * 1024 * 1024
+IMAGE_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+# Seconds a change to the cache index waits to be saved along with any that follow
+IMAGE_CACHE_SAVE_DELAY = 5
+
+# Seconds a room's participant list, and any user's status, is reused
+PARTICIPANTS_TTL = 60
+STATUS_TTL = 60
+# Most stale statuses fetched one by one; past this the full status list is paged
+STATUS_BULK_LIMIT = 50
+# Statuses per page of the full status list, and most pages read per fetch
+STATUS_PAGE_SIZE = 100
+STATUS_MAX_PAGES = 10
+
+# Formatted messages kept for redisplay, across all rooms, and local days whose
+# date strings are kept
+FORMAT_CACHE_SIZE = 20000
+DAY_CACHE_SIZE = 512
+
+# Messages shown when a room is opened
+INITIAL_HISTORY = 200
+
+# Lines of chat kept in a room's widget, and messages loaded per scroll-back
+CHAT_HISTORY_LINES = 1000
+HISTORY_PAGE = 50
+
+# Application log: widget flush interval, lines kept in the widget, log file rotation
+LOG_FLUSH_INTERVAL = 1/4
+LOG_MAX_LINES = 2000
+LOG_FILE_BYTES = 1024 * 1024
+LOG_FILE_COUNT = 3
+
+# Restart policy for supervised tasks: consecutive restarts, then the first and
+# longest backoff in seconds
+TASK_MAX_RESTARTS = 5
+TASK_RESTART_BACKOFF = 1
+TASK_RESTART_BACKOFF_MAX = 60
+
+# Upper bounds, in seconds, of the request latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
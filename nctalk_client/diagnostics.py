@@ -0,0 +1,165 @@
+import json
+import time
+
+import tkinter as tk
+import pygubu
+
+from tkinter import ttk, filedialog
+
+from typing import Any, Dict, Iterable, Optional
+
+from .images import Image
+from .instrumentation import RequestStats
+from .task_manager import TaskManager
+from .ui import ui_builder
+
+REQUEST_COLUMNS = (
+    ('calls', 'Calls'),
+    ('errors', 'Errors'),
+    ('not_modified', '304s'),
+    ('received', 'Received'),
+    ('mean', 'Mean'),
+    ('p50', 'p50'),
+    ('p95', 'p95'),
+)
+
+TASK_COLUMNS = (
+    ('running', 'Running'),
+    ('runs', 'Runs'),
+    ('failures', 'Failures'),
+    ('restarts', 'Restarts'),
+    ('wall_time', 'Wall time'),
+    ('last_error', 'Last error'),
+)
+
+
+def format_seconds(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return '-'
+    if seconds == float('inf'):
+        return 'slow'
+    if seconds < 1:
+        return f'{seconds * 1000:.0f} ms'
+    return f'{seconds:.1f} s'
+
+
+def format_bytes(size: int) -> str:
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024:
+            return f'{size:.0f} {unit}'
+        size /= 1024
+    return f'{size:.1f} GiB'
+
+
+class DiagnosticsWindow:
+    """Show request, task and cache statistics, and export them as JSON."""
+
+    def __init__(
+            self,
+            stats: Optional[RequestStats],
+            loop: TaskManager,
+            rooms: Iterable[Any],
+            master=None):
+
+        self.stats = stats
+        self.loop = loop
+        self.rooms = rooms
+
+        self.builder: pygubu.Builder = ui_builder('diagnostics.ui')
+
+        self.window: tk.Toplevel = self.builder.get_object('diagnostics_window', master)
+
+        self.cache_summary = None
+        self.connection_summary = None
+        self.builder.import_variables(self, ['cache_summary', 'connection_summary'])
+        self.builder.connect_callbacks(self)
+
+        self.requests_tree: ttk.Treeview = self.builder.get_object('requests_tree')
+        self.tasks_tree: ttk.Treeview = self.builder.get_object('tasks_tree')
+        self.__setup_tree(self.requests_tree, 'Endpoint', REQUEST_COLUMNS)
+        self.__setup_tree(self.tasks_tree, 'Task', TASK_COLUMNS)
+
+        self.refresh()
+
+    def __setup_tree(self, tree: ttk.Treeview, title: str, columns):
+        tree.configure(columns=[name for name, _ in columns])
+        tree.heading('#0', text=title, anchor='w')
+        tree.column('#0', width=260, stretch=True)
+        for name, heading in columns:
+            tree.heading(name, text=heading, anchor='e')
+            tree.column(name, width=80, anchor='e', stretch=False)
+
+    def room_names(self) -> Dict[str, str]:
+        return {room.token: room.displayName for room in self.rooms}
+
+    def refresh(self):
+        """Redraw every table from the current statistics."""
+        self.requests_tree.delete(*self.requests_tree.get_children())
+        if self.stats:
+            names = self.room_names()
+            for title, group, label in (
+                    ('Endpoints', self.stats.by_endpoint, lambda k: k),
+                    ('Rooms', self.stats.by_room, lambda k: names.get(k, k))):
+                parent = self.requests_tree.insert('', tk.END, text=title, open=True)
+                for key, endpoint in sorted(group.items()):
+                    self.requests_tree.insert(parent, tk.END, text=label(key), values=(
+                        endpoint.calls,
+                        endpoint.errors,
+                        endpoint.status_codes[304],
+                        format_bytes(endpoint.bytes_received),
+                        format_seconds(
+                            endpoint.total_time / endpoint.calls if endpoint.calls else None),
+                        format_seconds(endpoint.percentile(50)),
+                        format_seconds(endpoint.percentile(95))))
+
+        self.tasks_tree.delete(*self.tasks_tree.get_children())
+        for task in self.loop.diagnostics():
+            self.tasks_tree.insert('', tk.END, text=task['name'], values=(
+                task['running'],
+                task['runs'],
+                task['failures'],
+                task['restarts'],
+                format_seconds(task['wall_time']),
+                task['last_error'] or ''))
+
+        if Image.disk_cache:
+            cache = Image.disk_cache.stats
+            self.cache_summary.set(
+                f'Attachment cache: {cache["entries"]} files, {format_bytes(cache["bytes"])}, '
+                f'{cache["hits"]} hits, {cache["misses"]} misses, '
+                f'{cache["evictions"]} evictions')
+        else:
+            self.cache_summary.set('Attachment cache: not open')
+
+        if self.stats:
+            connections = self.stats.connections
+            reuse = connections.reuse_ratio
+            self.connection_summary.set(
+                f'Connections: {connections.connections} opened, '
+                f'{connections.tls_handshakes} TLS handshakes, '
+                f'{connections.requests} requests ({connections.http2_requests} over HTTP/2), '
+                f'{"-" if reuse is None else f"{reuse:.0%}"} reused')
+        else:
+            self.connection_summary.set('Connections: not logged in')
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'exported': time.time(),
+            'requests': self.stats.as_dict() if self.stats else None,
+            'room_names': self.room_names(),
+            'tasks': self.loop.diagnostics(),
+            'attachment_cache': Image.disk_cache.stats if Image.disk_cache else None,
+        }
+
+    def export_json(self):
+        filename = filedialog.asksaveasfilename(
+            parent=self.window,
+            title='Export Diagnostics',
+            defaultextension='.json',
+            initialfile='nctalk-diagnostics.json',
+            filetypes=[('JSON', '*.json')])
+        if not filename:
+            return
+
+        with open(filename, 'w') as fp:
+            json.dump(self.as_dict(), fp, indent=2)
@@ -0,0 +1,172 @@
+"""Turn chat messages into tagged text, parsing each message only once."""
+
+import functools
+import re
+import time
+
+import datetime as dt
+
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .constants import FORMAT_CACHE_SIZE, DAY_CACHE_SIZE
+from .messages import Message
+
+# Rich object placeholders in message text, like {mention-user1} or {file}
+PLACEHOLDER = re.compile(r'\{([A-Za-z0-9_-]+)\}')
+
+# Text of a message and the Text widget tags to show it with
+Segment = Tuple[str, Tuple[str, ...]]
+
+
+class Day:
+    """One local calendar day, with the date work for its timestamps done up front."""
+
+    def __init__(self, ordinal: int):
+        date = dt.date.fromordinal(ordinal)
+        self.ordinal = ordinal
+        self.label = date.isoformat()
+        self.start = int(time.mktime(date.timetuple()))
+        self.end = int(time.mktime((date + dt.timedelta(days=1)).timetuple()))
+
+    def __contains__(self, timestamp: int) -> bool:
+        return self.start <= timestamp < self.end
+
+    def time_of(self, timestamp: int) -> str:
+        """Return the local HH:MM:SS of `timestamp`, which falls on this day."""
+        if self.end - self.start != 86400:
+            # Daylight saving time starts or ends today.
+            return dt.datetime.fromtimestamp(timestamp).strftime(r'%H:%M:%S')
+        seconds = timestamp - self.start
+        return f'{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}'
+
+
+@functools.lru_cache(maxsize=DAY_CACHE_SIZE)
+def local_day(ordinal: int) -> Day:
+    return Day(ordinal)
+
+
+class DayFormatter:
+    """Find the local day of timestamps, remembering the last day used.
+
+    Messages mostly arrive in order, so nearly every timestamp falls on the
+    day of the one before it and is placed with two comparisons.
+    """
+
+    def __init__(self):
+        self.current: Optional[Day] = None
+
+    def day_of(self, timestamp: int) -> Day:
+        if self.current is None or timestamp not in self.current:
+            ordinal = dt.date.fromtimestamp(timestamp).toordinal()
+            self.current = local_day(ordinal)
+        return self.current
+
+
+class FormattedMessage:
+    """A message parsed into segments, ready to insert.
+
+    `segments` hold the whole message, header and trailing newline included;
+    `lines` is how many lines they take up.
+    """
+
+    def __init__(self, msg: Message, day: Day, segments: List[Segment]):
+        self.id = msg['id']
+        self.text = msg['message']
+        self.day = day
+        self.segments = segments
+        self.lines = sum(text.count('\n') for text, _ in segments)
+
+
+class MessageFormatter:
+    """Format messages of every room, keeping the newest FORMAT_CACHE_SIZE.
+
+    Rich object parameters such as mentions, files, calls and polls are
+    parsed into tagged segments the first time a message is seen.  Showing
+    the same message again, for example when scrolling back to history
+    that was trimmed from the window, is a cache lookup.
+    """
+
+    # Formatted messages by id, least recently used first
+    cache: 'OrderedDict[int, FormattedMessage]' = OrderedDict()
+    days = DayFormatter()
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+
+    @staticmethod
+    def is_image(msg: Message) -> bool:
+        if msg['message'] != '{file}':
+            return False
+        parameters = msg.get('messageParameters')
+        return isinstance(parameters, dict) and \
+            'image' in parameters.get('file', {}).get('mimetype', '')
+
+    def format(self, msg: Message) -> FormattedMessage:
+        formatted = self.cache.get(msg['id'])
+        # Edited and deleted messages keep their id.
+        if formatted is None or formatted.text != msg['message']:
+            formatted = self.__format(msg)
+            self.cache[msg['id']] = formatted
+            if len(self.cache) > FORMAT_CACHE_SIZE:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(msg['id'])
+        return formatted
+
+    def day_separator(self, ordinal: int) -> Segment:
+        """Return the line put between messages of different days, before `ordinal`."""
+        return f'\n---{local_day(ordinal).label}---\n', ('day',)
+
+    def __format(self, msg: Message) -> FormattedMessage:
+        day = self.days.day_of(msg['timestamp'])
+        time_segment = (f'({day.time_of(msg["timestamp"])}) ', ('time',))
+
+        if msg.get('systemMessage'):
+            body = [(text, ('system', *tags)) for text, tags in self.parse(msg)]
+            segments = [time_segment, *body, ('\n', ())]
+        elif self.is_image(msg):
+            segments = [time_segment, (f'{msg["actorDisplayName"]} [Sent Attachment]\n', ())]
+        else:
+            segments = [
+                time_segment,
+                (f'{msg["actorDisplayName"]}: ', ('actor',)),
+                *self.parse(msg),
+                ('\n', ())]
+
+        return FormattedMessage(msg, day, segments)
+
+    def parse(self, msg: Message) -> List[Segment]:
+        """Split the message text into plain text and tagged rich objects."""
+        text = msg['message']
+        parameters = msg.get('messageParameters')
+        if not isinstance(parameters, dict) or '{' not in text:
+            return [(text, ())]
+
+        segments = []
+        position = 0
+        for match in PLACEHOLDER.finditer(text):
+            parameter = parameters.get(match.group(1))
+            if not isinstance(parameter, dict):
+                continue
+            if match.start() > position:
+                segments.append((text[position:match.start()], ()))
+            segments.append(self.rich_object(parameter))
+            position = match.end()
+        if position < len(text):
+            segments.append((text[position:], ()))
+        return segments
+
+    def rich_object(self, parameter: Dict[str, Any]) -> Segment:
+        kind = parameter.get('type')
+        name = parameter.get('name', '')
+        match kind:
+            case 'user' | 'guest' | 'user-group' | 'group' | 'call':
+                own = kind == 'user' and parameter.get('id') == self.user_id
+                return f'@{name}', ('mention_self' if own else 'mention',)
+            case 'file':
+                return name, ('file',)
+            case 'talk-poll':
+                return f'Poll: {name}', ('object',)
+            case _:
+                return name, ('object',)
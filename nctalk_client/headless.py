@@ -0,0 +1,262 @@
+"""Stream new messages from every room as JSON lines, without a UI.
+
+Nothing here imports tkinter or PIL, so this runs on servers that have
+neither.
+"""
+
+import asyncio
+import httpx
+import json
+import logging
+import os
+import signal
+import stat
+import sys
+
+from typing import Any, Awaitable, Callable, Dict, Optional, TextIO
+
+from nextcloud_async.exceptions import NextCloudException
+
+from .config import NCTalkConfiguration
+from .health import ServerHealth, is_server_failure
+from .logs import Logger
+from .registry import RoomRegistry
+from .scheduler import PollScheduler
+from .sync import RoomList, RoomSync
+from .task_manager import TaskManager
+from .transport import create_nextcloud, HAS_HTTP2
+from .constants import (
+    HTTP_VERSION, BACKGROUND_POLL_INTERVAL, BACKGROUND_POLL_RATE, ROOM_LIST_INTERVAL,
+    ROOM_LIST_FULL_REFRESH, HEALTH_FAILURE_THRESHOLD, HEALTH_BACKOFF, HEALTH_BACKOFF_MAX,
+    HEADLESS_QUEUE_SIZE, HEADLESS_HISTORY_FETCHES, HEADLESS_STATE_INTERVAL)
+
+
+class HeadlessClient:
+    """Follow every room of one account and write each new message as a JSON line.
+
+    Rooms are RoomSyncs polled by the same PollScheduler as in the GUI, with
+    no focused room: a room is polled once the room list shows it has new
+    messages.  All rooms share one queue of at most HEADLESS_QUEUE_SIZE
+    messages, so polling waits whenever `output` falls behind, and memory use
+    does not grow with traffic.
+
+    With a `state_file`, the id of the last message written for each room is
+    saved there, and the next run carries on from it.  Rooms without saved
+    state start with their `history` newest messages.
+    """
+
+    def __init__(
+            self,
+            loop: asyncio.BaseEventLoop,
+            output: TextIO,
+            endpoint: str,
+            user: str,
+            password: str,
+            state_file: Optional[str] = None,
+            history: int = 0):
+
+        self.loop = TaskManager(loop)
+        self.output = output
+        self.endpoint = endpoint
+        self.user = user
+        self.password = password
+        self.state_file = state_file
+        self.history = history
+
+        self.app_config = NCTalkConfiguration()
+        self.logger = Logger(
+            level=self.app_config.log_level(),
+            stream=sys.stderr)
+
+        self.rooms = RoomRegistry()
+        self.queue = asyncio.Queue(
+            maxsize=self.app_config.get('headless_queue_size', HEADLESS_QUEUE_SIZE))
+        self.history_fetches = asyncio.Semaphore(HEADLESS_HISTORY_FETCHES)
+
+        # Room token -> id of the last message written
+        self.cursors: Dict[str, int] = self.load_state()
+        self.cursors_saved = dict(self.cursors)
+
+        self.nca = None
+        self.health = None
+        self.room_list = None
+        self.closed = False
+        self.exit_status = 0
+
+    def start(self):
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.loop.event_loop.add_signal_handler(signum, self.close)
+
+        self.scheduler = PollScheduler(
+            self.loop,
+            self.logger,
+            interval=self.app_config.get('poll_interval', BACKGROUND_POLL_INTERVAL),
+            rate=self.app_config.get('poll_rate', BACKGROUND_POLL_RATE))
+        self.loop.create_task(self.run(), name='connect')
+
+    async def run(self):
+        """Connect, exiting with a nonzero status if that fails for good."""
+        try:
+            await self.connect()
+        except Exception as e:
+            await self.logger(f'Unable to start: {e!r}', logging.ERROR)
+            self.exit_status = 1
+            self.close()
+
+    async def connect(self):
+        if self.app_config.get('http_version', HTTP_VERSION) == 'HTTP/2' and not HAS_HTTP2:
+            await self.logger('HTTP/2 needs the h2 package, falling back to HTTP/1.1')
+
+        for key, value in self.app_config.invalid.items():
+            await self.logger(f'Ignoring invalid setting {key}={value!r}', logging.WARNING)
+        await self.logger(f'Logging in to {self.endpoint} as {self.user}')
+        self.nca = create_nextcloud(self.app_config, self.endpoint, self.user, self.password)
+        self.health = ServerHealth(
+            self.nca,
+            self.loop,
+            self.logger,
+            threshold=self.app_config.get(
+                'health_failure_threshold', HEALTH_FAILURE_THRESHOLD),
+            backoff=self.app_config.get('health_backoff', HEALTH_BACKOFF),
+            backoff_max=self.app_config.get('health_backoff_max', HEALTH_BACKOFF_MAX))
+        self.room_list = RoomList(
+            self.nca, self.logger, self.rooms, self.health, self.add_room, self.retire_room)
+
+        await self.until_done('Login', self.nca.get_user)
+        conversations = await self.until_done(
+            'Fetching the room list', self.nca.get_conversations)
+        await self.logger(f'Following {len(conversations)} rooms')
+        for data in conversations:
+            await self.add_room(data)
+
+        self.loop.supervise(self.write_messages, name='output')
+        self.loop.supervise(self.save_state_loop, name='state')
+        self.scheduler.start(self.health)
+        self.loop.supervise(
+            lambda: self.room_list.refresh_loop(
+                interval=self.app_config.get('room_list_interval', ROOM_LIST_INTERVAL),
+                full_every=self.app_config.get(
+                    'room_list_full_refresh', ROOM_LIST_FULL_REFRESH)),
+            name='room-list')
+
+    async def until_done(self, what: str, request: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the result of `request()`, retrying it while the server is failing.
+
+        Any other failure, such as wrong credentials, is raised.
+        """
+        while True:
+            await self.health.wait()
+            try:
+                result = await request()
+            except (httpx.HTTPError, NextCloudException) as e:
+                if not is_server_failure(e):
+                    raise
+                await self.logger(f'{what} failed: {e!r}', logging.WARNING)
+                await self.health.failed(e)
+                await asyncio.sleep(self.health.backoff())
+            else:
+                self.health.succeeded()
+                return result
+
+    async def add_room(self, data: Dict[str, Any]):
+        room = RoomSync(self.nca, self.loop, self.logger, data, msg_queue=self.queue)
+        self.rooms.add(room)
+        self.scheduler.add(room)
+
+        if room.token in self.cursors:
+            room.last_read = self.cursors[room.token]
+            room.ready.set()
+        elif self.history:
+            self.loop.supervise(
+                lambda: self.fetch_history(room), name=f'room-{room.token}-history')
+        else:
+            # Only what is posted from now on
+            if isinstance(last_message := data.get('lastMessage'), dict):
+                room.last_read = last_message.get('id', 0)
+            self.cursors[room.token] = room.last_read
+            room.ready.set()
+
+    async def fetch_history(self, room: RoomSync):
+        """Fetch the newest messages of `room`, then leave it to the scheduler.
+
+        Server failures are retried here.  Whatever else goes wrong, the room
+        is still polled from then on, and a restart finds it ready and stops.
+        """
+        if room.ready.is_set():
+            return
+        try:
+            async with self.history_fetches:
+                if room.token in self.rooms:
+                    await self.until_done(
+                        f'[{room.displayName}] Fetching history',
+                        lambda: room.receive_messages(look_into_future=0, limit=self.history))
+        finally:
+            room.ready.set()
+
+    def retire_room(self, room: RoomSync):
+        self.loop.remove(f'room-{room.token}-history')
+        self.scheduler.remove(room)
+        self.rooms.remove(room)
+        self.cursors.pop(room.token, None)
+
+    async def write_messages(self):
+        """Write queued messages, flushing once the queue is drained."""
+        while True:
+            msg = await self.queue.get()
+            while True:
+                self.output.write(json.dumps(msg, ensure_ascii=False) + '\n')
+                token = msg.get('token')
+                if token:
+                    self.cursors[token] = max(self.cursors.get(token, 0), msg['id'])
+                try:
+                    msg = self.queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+            self.output.flush()
+
+    def load_state(self) -> Dict[str, int]:
+        if not self.state_file:
+            return {}
+        try:
+            with open(self.state_file) as fp:
+                state = json.load(fp)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            self.logger.sink.warning(f'Ignoring unreadable state file: {e}')
+            return {}
+        if not isinstance(state, dict):
+            self.logger.sink.warning('Ignoring state file that is not a JSON object')
+            return {}
+        return state
+
+    def save_state(self):
+        """Write the cursors to `state_file`, replacing it atomically."""
+        if not self.state_file or self.cursors == self.cursors_saved:
+            return
+
+        temp_file = f'{self.state_file}.tmp'
+        with open(temp_file, 'w') as fp:
+            json.dump(self.cursors, fp)
+        os.chmod(temp_file, mode=stat.S_IRUSR | stat.S_IWUSR)
+        os.replace(temp_file, self.state_file)
+        self.cursors_saved = dict(self.cursors)
+
+    async def save_state_loop(self):
+        interval = self.app_config.get('headless_state_interval', HEADLESS_STATE_INTERVAL)
+        while True:
+            await asyncio.sleep(interval)
+            self.save_state()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+
+        self.scheduler.shutdown()
+        if self.health:
+            self.health.shutdown()
+        self.output.flush()
+        self.save_state()
+        self.logger.shutdown()
+        self.loop.shutdown()
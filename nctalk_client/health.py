@@ -0,0 +1,129 @@
+"""Track whether the server is reachable, for the whole account."""
+
+import asyncio
+import httpx
+import logging
+import random
+
+from typing import Awaitable, Callable, List, Optional
+
+from nextcloud_async import NextCloudAsync
+from nextcloud_async.exceptions import (
+    NextCloudException, NextCloudRequestTimeout, NextCloudTooManyRequests)
+
+from .constants import HEALTH_FAILURE_THRESHOLD, HEALTH_BACKOFF, HEALTH_BACKOFF_MAX
+from .logs import Logger
+from .task_manager import TaskManager
+
+
+def is_server_failure(error: BaseException) -> bool:
+    """Return whether `error` means the server, not the request, is in trouble."""
+    if isinstance(error, (httpx.TransportError, NextCloudRequestTimeout,
+                          NextCloudTooManyRequests)):
+        return True
+    return isinstance(error, NextCloudException) and (error.status_code or 0) >= 500
+
+
+class ServerHealth:
+    """Account-wide circuit breaker in front of the server.
+
+    Everything that polls the server reports each outcome here.  After
+    `threshold` server failures in a row the circuit opens: wait() blocks every
+    poller, and a single probe of the server's status page is retried with
+    exponential backoff and jitter, from `backoff` up to `backoff_max` seconds.
+    The first successful probe closes the circuit and every poller resumes.
+
+    Subscribers are awaited with True or False whenever the circuit closes or
+    opens.
+    """
+
+    def __init__(
+            self,
+            nca: NextCloudAsync,
+            loop: TaskManager,
+            logger: Logger,
+            threshold: int = HEALTH_FAILURE_THRESHOLD,
+            backoff: float = HEALTH_BACKOFF,
+            backoff_max: float = HEALTH_BACKOFF_MAX):
+
+        self.nca = nca
+        self.loop = loop
+        self.logger = logger
+        self.threshold = threshold
+        self.backoff_base = backoff
+        self.backoff_max = backoff_max
+
+        # Server failures since the last success
+        self.failures = 0
+        self.last_error: Optional[BaseException] = None
+        self.available = asyncio.Event()
+        self.available.set()
+        self.probe_task = None
+        self.subscribers: List[Callable[[bool], Awaitable[None]]] = []
+
+    @property
+    def healthy(self) -> bool:
+        return self.available.is_set()
+
+    def subscribe(self, callback: Callable[[bool], Awaitable[None]]):
+        self.subscribers.append(callback)
+
+    def backoff(self) -> float:
+        """Seconds to wait before retrying after the current run of failures.
+
+        The delay doubles with each failure, and half of it is random so
+        that clients cut off by the same outage do not all return at once.
+        """
+        ceiling = min(self.backoff_base * 2 ** max(self.failures - 1, 0), self.backoff_max)
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    async def wait(self):
+        """Return once the server is considered available."""
+        await self.available.wait()
+
+    def succeeded(self):
+        self.failures = 0
+
+    async def failed(self, error: BaseException):
+        """Count a server failure, opening the circuit after `threshold` of them."""
+        self.failures += 1
+        self.last_error = error
+        if self.healthy and self.failures >= self.threshold:
+            self.available.clear()
+            await self.logger(
+                f'Server unavailable after {self.failures} failures '
+                f'({type(error).__name__}: {error}), '
+                'pausing until it responds again', logging.WARNING)
+            await self.notify(False)
+            self.probe_task = self.loop.create_task(self.probe())
+
+    async def probe(self):
+        """Check the server until it responds, then close the circuit."""
+        while True:
+            delay = self.backoff()
+            await self.logger(f'Checking the server again in {delay:.1f}s', logging.DEBUG)
+            await asyncio.sleep(delay)
+            try:
+                response = await self.nca.request(method='GET', sub='/status.php')
+                if response.json().get('maintenance'):
+                    raise NextCloudException(status_code=503, reason='Maintenance mode')
+            except (httpx.HTTPError, NextCloudException, ValueError) as e:
+                self.failures += 1
+                self.last_error = e
+            else:
+                break
+
+        self.failures = 0
+        self.probe_task = None
+        self.available.set()
+        await self.logger('Server available again, resuming')
+        await self.notify(True)
+
+    async def notify(self, available: bool):
+        for callback in self.subscribers:
+            await callback(available)
+
+    def shutdown(self):
+        if self.probe_task:
+            self.probe_task.cancel()
+            self.probe_task = None
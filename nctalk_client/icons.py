@@ -1,23 +1,28 @@
 
 import os
 import stat
-import aiofiles
-import asyncio
 
 from io import BytesIO
+from typing import Dict, Optional, Tuple
 
 import platformdirs as pdir
 import tkinter as tk
 
-from PIL import Image, ImageTk
+from PIL import Image
 
-from .constants import PROJECT_ICONS
+from .constants import PROJECT_ICONS, ICON_SIZE
 
 
 class Icons:
+    """Ready-to-use icons, decoded once per process.
 
-    icon_memory_cache = {}
-    write_lock = asyncio.Lock()
+    PhotoImages are kept in a class-level cache keyed by (name, size), so
+    every room shares them and a lookup is a dictionary hit.  Call preload()
+    once Tk is up to decode every icon at the configured size.
+    """
+
+    icon_cache: Dict[Tuple[str, int], tk.PhotoImage] = {}
+    size: int = ICON_SIZE
 
     def __init__(self):
         self.cache_path = pdir.user_cache_path('nctalk/icons')
@@ -26,51 +31,37 @@ class Icons:
     async def __call__(self, *args, **kwargs):
         return await self.load_icon(*args, **kwargs)
 
-    async def load_icon(self, icon_name: str, size: int) -> tk.PhotoImage:
+    @classmethod
+    def preload(cls, size: int = ICON_SIZE):
+        """Decode every bundled icon at `size` and make it the default size."""
+        cls.size = size
+        icons = cls()
+        for icon_file in PROJECT_ICONS.glob('*.png'):
+            icons.get(icon_file.stem, size)
+
+    async def load_icon(self, icon_name: str, size: Optional[int] = None) -> tk.PhotoImage:
         """Return icon at proper size.
 
         Args:
             icon_name (str): Basename of icon, without extension.
 
-            size (int): Width/Height of resized icon
+            size (int): Width/Height of resized icon.  Defaults to the
+            preloaded size.
 
         Returns:
             tk.PhotoImage: Image sized to Size x Size
 
         """
-        icon_key = f'{icon_name}_{size}'
-        icon: tk.PhotoImage
-
-        if self.__in_memory_cache(icon_key):
-            icon = tk.PhotoImage(data=self.icon_memory_cache[icon_key])
-        elif self.__in_disk_cache(icon_key):
-            icon = await self.__from_disk_cache(icon_key)
-            await self.__save_to_memory_cache(icon_key)
-        else:
-            with BytesIO() as buffer:
-                icon = await self.__sized_icon_from_disk(icon_name, size, buffer)
-                await self.__save_to_disk_cache(icon_key, icon)
-                await self.__save_to_memory_cache(icon_key)
-        return icon
+        return self.get(icon_name, size or self.size)
 
-    def __in_memory_cache(self, icon_key: str):
-        if icon_key in self.icon_memory_cache.keys():
-            return True
-        else:
-            return False
+    def get(self, icon_name: str, size: int) -> tk.PhotoImage:
+        icon_key = (icon_name, size)
+        if icon_key not in self.icon_cache:
+            self.icon_cache[icon_key] = self.__build_icon(icon_name, size)
+        return self.icon_cache[icon_key]
 
-    def __in_disk_cache(self, icon_key):
-        if f'{icon_key}.png' in os.listdir(self.cache_path):
-            return True
-        else:
-            return False
-
-    async def __from_disk_cache(self, icon_key: str):
-        icon_filename = f'{self.cache_path}/{icon_key}.png'
-        return tk.PhotoImage(file=icon_filename)
-
-    async def __sized_icon_from_disk(self, icon_name: str, size: int, buffer: BytesIO):
-        """Load full-sized PNG icon from project directory.
+    def __build_icon(self, icon_name: str, size: int) -> tk.PhotoImage:
+        """Load a sized icon from the disk cache, resizing and caching it if needed.
 
         Args
         ----
@@ -78,52 +69,16 @@ class Icons:
 
             size (int): Size squared
 
-        Returns
-        -------
-
-        """
-        icon_filename = PROJECT_ICONS / f'{icon_name}.png'
-        async with aiofiles.open(icon_filename, mode='rb') as icon_fp:
-            buffer.write(await icon_fp.read())
-            buffer.seek(0)
-            pil_image = Image.open(buffer, formats=['PNG'])
-            resized_image = pil_image.resize(size=(size, size))
-            tk_image = self.__pil_to_tk(resized_image, buffer)
-            return tk_image
-
-    async def __save_to_disk_cache(self, icon_key: str, icon: Image):
-        """Save resized icon to cache directory and memory cache.
-
-        Args:
-        ----
-            icon_name (str): Basename of icon file, without .png extension
-
-            size (int): Size of icon
-
-            image (Image): Image to save
-
         """
-        icon_filename = f'{self.cache_path}/{icon_key}.png'
-        async with self.write_lock:
-            icon.write(icon_filename, format='PNG')
-
-    async def __save_to_memory_cache(self, icon_key: str):
-        """Save image to memory cache.
-
-        Image must already be stored in disk cache.
+        icon_filename = f'{self.cache_path}/{icon_name}_{size}.png'
+        if os.path.exists(icon_filename):
+            return tk.PhotoImage(file=icon_filename)
 
-        Args:
-        ----
-            icon_key (str): Icon type and size
+        with BytesIO() as buffer:
+            pil_image = Image.open(PROJECT_ICONS / f'{icon_name}.png', formats=['PNG'])
+            resized_image = pil_image.resize(size=(size, size))
+            resized_image.save(buffer, format='PNG')
+            icon = tk.PhotoImage(data=buffer.getvalue())
 
-        """
-        icon_filename = f'{self.cache_path}/{icon_key}.png'
-        async with self.write_lock:
-            async with aiofiles.open(icon_filename, mode='rb') as icon_fp:
-                self.icon_memory_cache[icon_key] = await icon_fp.read()
-
-    def __pil_to_tk(self, pil_image, buffer):
-        buffer.seek(0)
-        pil_image.save(buffer, format='PNG')
-        buffer.seek(0)
-        return tk.PhotoImage(data=buffer.read())
+        icon.write(icon_filename, format='PNG')
+        return icon
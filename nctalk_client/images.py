@@ -1,92 +1,287 @@
 import os
-import stat
+import asyncio
 import aiofiles
+import contextlib
 import hashlib
+import httpx
+import time
+import uuid
 
+from collections import OrderedDict
 from io import BytesIO
+from typing import Any, Callable, Dict, Optional, Tuple
 
 import platformdirs as pdir
 
 from PIL import ImageTk, Image as ImagePIL
 
 from nextcloud_async import NextCloudAsync
+from nextcloud_async.exceptions import (
+    NextCloudException, NextCloudNotFound, NextCloudRequestTimeout, NextCloudTooManyRequests)
+
+from .cache import DiskCache
+from .constants import (
+    IMAGE_MEMORY_CACHE_BYTES, IMAGE_CACHE_BYTES, IMAGE_CACHE_MAX_AGE, PREVIEW_MAX_ASPECT,
+    DOWNLOAD_CHUNK_SIZE)
+
+# Called with the bytes received so far and the total size, if known
+Progress = Callable[[int, Optional[int]], None]
+
+
+class PhotoImageCache:
+    """Keep recently shown PhotoImages, up to roughly `max_bytes` of pixels."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.images: OrderedDict = OrderedDict()
+
+    def __contains__(self, key: Tuple[str, int]) -> bool:
+        return key in self.images
+
+    def get(self, key: Tuple[str, int]) -> ImageTk.PhotoImage:
+        self.images.move_to_end(key)
+        return self.images[key]
+
+    def put(self, key: Tuple[str, int], image: ImageTk.PhotoImage):
+        if key in self.images:
+            self.size -= self.__image_size(self.images.pop(key))
+
+        self.images[key] = image
+        self.size += self.__image_size(image)
+
+        while self.size > self.max_bytes and len(self.images) > 1:
+            _, evicted = self.images.popitem(last=False)
+            self.size -= self.__image_size(evicted)
+
+    def __image_size(self, image: ImageTk.PhotoImage) -> int:
+        return image.width() * image.height() * 4
 
 
 class Image:
 
+    memory_cache = PhotoImageCache(IMAGE_MEMORY_CACHE_BYTES)
+    disk_cache: DiskCache = None
+
     def __init__(self):
-        self.cache_path = pdir.user_cache_path('nctalk/images')
-        self.cache_path.mkdir(parents=True, exist_ok=True, mode=stat.S_IRWXU)
+        if not Image.disk_cache:
+            Image.open_disk_cache()
 
     async def __call__(self, *args, **kwargs):
         return await self.load_image(*args, **kwargs)
 
-    @property
-    def hashed_cache_directory(self):
-        hash_dirs: str = ''
-        for x in range(0, 12, 2):
-            hash_dirs = f'{hash_dirs}/{self.sha256[x:x+2]}'.strip('/')
+    @classmethod
+    def open_disk_cache(
+            cls,
+            max_bytes: int = IMAGE_CACHE_BYTES,
+            max_age: float = IMAGE_CACHE_MAX_AGE):
+        """Open the shared attachment cache with the given budget."""
+        cls.disk_cache = DiskCache(
+            pdir.user_cache_path('nctalk/images'), max_bytes=max_bytes, max_age=max_age)
 
-        return self.cache_path / hash_dirs
+    def cache_key(self, height: int = 0) -> str:
+        return self.sha256 if height == 0 else f'{self.sha256}_{height}'
 
     @property
     def hashed_cache_filename(self):
-        return self.hashed_cache_directory / self.sha256
+        return self.disk_cache.path(self.sha256)
 
     def __in_cache(self, height: int = 0):
-        if height == 0:
-            return os.path.exists(self.hashed_cache_filename)
-        else:
-            return os.path.exists(f'{self.hashed_cache_filename}_{height}')
+        return self.disk_cache.get(self.cache_key(height))
 
     def __cache_mkdir(self):
-        self.hashed_cache_directory.mkdir(parents=True, exist_ok=True, mode=stat.S_IRWXU)
+        self.disk_cache.mkdir(self.sha256)
+
+    async def __download(
+            self,
+            nca: NextCloudAsync,
+            endpoint: str,
+            url: str,
+            params: Optional[Dict[str, Any]] = None,
+            max_bytes: int = 0,
+            progress: Optional[Progress] = None):
+        """Stream `url` into the cache file, one chunk at a time.
+
+        The body is written to a temporary file beside the cache file and
+        renamed into place once complete, so a failed download never leaves a
+        partial image behind.  Downloads larger than `max_bytes`, if given,
+        are abandoned as soon as that is known.
+
+        The download bypasses nca.request(), so an InstrumentedNextCloud's
+        statistics get it recorded here, under `endpoint`.
+        """
+        self.__cache_mkdir()
+        cache_file = self.hashed_cache_filename
+        temp_file = cache_file.with_name(f'{cache_file.name}.{uuid.uuid4().hex}.part')
+        received = 0
+
+        stats = getattr(nca, 'stats', None)
+        status, error = None, None
+        start = time.monotonic()
+        try:
+            async with nca.client.stream(
+                    'GET', url, params=params, auth=(nca.user, nca.password)) as response:
+                status = response.status_code
+                match response.status_code:
+                    case 404:
+                        raise NextCloudNotFound()
+                    case 429:
+                        raise NextCloudTooManyRequests()
+                    case _ if response.status_code >= 400:
+                        raise NextCloudException(response.status_code, response.reason_phrase)
+
+                # A compressed body's length says nothing of the decoded bytes
+                # counted below.
+                if response.headers.get('Content-Encoding', 'identity') != 'identity':
+                    total = None
+                else:
+                    total = int(response.headers.get('Content-Length', 0)) or None
+                if max_bytes and total and total > max_bytes:
+                    raise self.__too_large(max_bytes)
 
-    async def __write_cache_file(self, data):
-        async with aiofiles.open(self.hashed_cache_filename, mode='wb') as image_fp:
-            await image_fp.write(data)
+                async with aiofiles.open(temp_file, mode='wb') as image_fp:
+                    async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        received += len(chunk)
+                        if max_bytes and received > max_bytes:
+                            raise self.__too_large(max_bytes)
+                        await image_fp.write(chunk)
+                        if progress:
+                            progress(received, total)
 
-    async def from_url(self, nca: NextCloudAsync, url: str) -> None:
+            os.replace(temp_file, cache_file)
+        except httpx.ReadTimeout as e:
+            error = type(e).__name__
+            raise NextCloudRequestTimeout()
+        except NextCloudException as e:
+            status = status or e.status_code
+            error = type(e).__name__
+            raise
+        except httpx.HTTPError as e:
+            error = type(e).__name__
+            raise
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp_file)
+            if stats:
+                stats.record(
+                    endpoint, None,
+                    elapsed=time.monotonic() - start,
+                    status=status,
+                    sent=0,
+                    received=received,
+                    error=error)
+
+        self.disk_cache.put(self.sha256, received)
+
+    @staticmethod
+    def __too_large(max_bytes: int) -> NextCloudException:
+        return NextCloudException(status_code=413, reason=f'Larger than {max_bytes} bytes')
+
+    async def from_url(
+            self,
+            nca: NextCloudAsync,
+            url: str,
+            max_bytes: int = 0,
+            progress: Optional[Progress] = None) -> None:
         """Save image from URL."""
         self.sha256 = hashlib.sha256(bytes(url, 'utf-8')).hexdigest()
-        response = await nca.request(method='GET', url=url)
-        self.__cache_mkdir()
-        await self.__write_cache_file(response.content)
+        await self.__download(
+            nca, 'download_url', url, max_bytes=max_bytes, progress=progress)
 
-    async def from_file(self, nca: NextCloudAsync, path: str) -> None:
+    async def from_file(
+            self,
+            nca: NextCloudAsync,
+            path: str,
+            max_bytes: int = 0,
+            progress: Optional[Progress] = None) -> None:
         """Save image from NextCloud path."""
         self.sha256 = hashlib.sha256(bytes(f'{nca.endpoint}/{path}', 'utf-8')).hexdigest()
 
         if self.__in_cache():
             return
 
-        image = await nca.download_file(path)
-        self.__cache_mkdir()
-        await self.__write_cache_file(image)
+        await self.__download(
+            nca, 'download_file', f'{nca.endpoint}/remote.php/dav/files/{nca.user}/{path}',
+            max_bytes=max_bytes, progress=progress)
+
+    async def from_preview(
+            self,
+            nca: NextCloudAsync,
+            file_id: str,
+            height: int,
+            max_bytes: int = 0,
+            progress: Optional[Progress] = None) -> None:
+        """Save the server's preview of file `file_id`, scaled to `height`.
+
+        Each size is cached separately, and the original is never downloaded.
+        """
+        self.sha256 = hashlib.sha256(
+            bytes(f'{nca.endpoint}/preview/{file_id}/{height}', 'utf-8')).hexdigest()
+
+        if self.__in_cache():
+            return
+
+        await self.__download(
+            nca,
+            'preview',
+            f'{nca.endpoint}/index.php/core/preview',
+            params={
+                'fileId': file_id,
+                'x': height * PREVIEW_MAX_ASPECT,
+                'y': height,
+                # Keep the aspect ratio, and 404 rather than send a file type icon.
+                'a': 1,
+                'forceIcon': 0,
+            },
+            max_bytes=max_bytes,
+            progress=progress)
 
-    def image(self, height: int = 0) -> ImageTk:
-        """Return sized image from hashed disk cache.
+    async def image(self, height: int = 0) -> ImageTk.PhotoImage:
+        """Return sized image, decoding it off the event loop if needed.
 
         Returns:
             tk.PhotoImage: Image data
 
         """
-        if height == 0:
-            return ImageTk.PhotoImage(ImagePIL.open(self.hashed_cache_filename))
-        else:
-            if self.__in_cache(height=height):
-                return ImageTk.PhotoImage(
-                    ImagePIL.open(f'{self.hashed_cache_filename}_{height}'))
+        key = (self.sha256, height)
+        if key in self.memory_cache:
+            return self.memory_cache.get(key)
+
+        pil_image = await asyncio.get_running_loop().run_in_executor(
+            None, self.__decode, height)
+
+        # PhotoImages belong to Tk, so they are only created on this thread.
+        image = ImageTk.PhotoImage(pil_image)
+        self.memory_cache.put(key, image)
+        return image
+
+    def __decode(self, height: int) -> ImagePIL.Image:
+        """Load the image scaled to `height`, caching the result on disk.
+
+        Runs in an executor.  JPEGs are decoded at a reduced scale when the
+        target is much smaller than the original.
+        """
+        sized_filename = self.disk_cache.path(self.cache_key(height))
+        if height != 0 and self.__in_cache(height=height):
+            try:
+                pil_image = ImagePIL.open(sized_filename)
+            except FileNotFoundError:
+                self.disk_cache.discard(self.cache_key(height))
             else:
-                full_size_image = ImagePIL.open(self.hashed_cache_filename)
-                if height < full_size_image.height:
-                    height_ratio = full_size_image.height / height
-                    new_width = int(full_size_image.width / height_ratio)
-                    resized_image = full_size_image.resize(size=(new_width, height))
-                    resized_image.save(f'{self.hashed_cache_filename}_{height}', format='PNG')
-                    return ImageTk.PhotoImage(resized_image)
-                else:
-                    return ImageTk.PhotoImage(ImagePIL.open(self.hashed_cache_filename))
+                pil_image.load()
+                return pil_image
+
+        pil_image = ImagePIL.open(self.hashed_cache_filename)
+        if height == 0 or height >= pil_image.height:
+            pil_image.load()
+            return pil_image
+
+        new_width = max(int(pil_image.width * height / pil_image.height), 1)
+        pil_image.draft(pil_image.mode, (new_width, height))
+        resized_image = pil_image.resize(size=(new_width, height), reducing_gap=2.0)
+        resized_image.save(sized_filename, format='PNG')
+        self.disk_cache.put(self.cache_key(height), os.path.getsize(sized_filename))
+        return resized_image
 
     @property
     async def thumbnail(self):
@@ -0,0 +1,252 @@
+"""Measure every request made to the Nextcloud server."""
+
+import bisect
+import collections
+import contextlib
+import contextvars
+import functools
+import json
+import time
+
+import httpx
+
+from typing import Any, Dict, Optional, Tuple
+
+from nextcloud_async import NextCloudAsync
+from nextcloud_async.exceptions import NextCloudException
+
+from .constants import LATENCY_BUCKETS
+
+# (endpoint, room token) of the API call currently being made
+current_call: contextvars.ContextVar[Optional[Tuple[str, Optional[str]]]] = \
+    contextvars.ContextVar('current_call', default=None)
+
+
+class EndpointStats:
+    """Latency histogram, traffic and outcomes of one group of requests."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.total_time = 0.0
+        self.status_codes = collections.Counter()
+        self.error_types = collections.Counter()
+        # One bucket per LATENCY_BUCKETS bound, plus one for anything slower
+        self.latency = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def record(
+            self,
+            elapsed: float,
+            status: Optional[int],
+            sent: int,
+            received: int,
+            error: Optional[str]):
+        self.calls += 1
+        self.total_time += elapsed
+        self.bytes_sent += sent
+        self.bytes_received += received
+        self.latency[bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+        if status:
+            self.status_codes[status] += 1
+        if error:
+            self.errors += 1
+            self.error_types[error] += 1
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Return the upper bound of the latency bucket holding percentile `p`."""
+        if not self.calls:
+            return None
+        threshold = self.calls * p / 100
+        count = 0
+        for bound, bucket in zip(LATENCY_BUCKETS + (float('inf'),), self.latency):
+            count += bucket
+            if count >= threshold:
+                return bound
+        return float('inf')
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'total_time': self.total_time,
+            'mean_latency': self.total_time / self.calls if self.calls else None,
+            'p50_latency': self.percentile(50),
+            'p95_latency': self.percentile(95),
+            'status_codes': {str(k): v for k, v in self.status_codes.items()},
+            'error_types': dict(self.error_types),
+            'latency_buckets': {
+                str(bound): count
+                for bound, count in zip(LATENCY_BUCKETS + ('inf',), self.latency)},
+        }
+
+
+class ConnectionStats:
+    """How often requests open a new connection rather than reuse one.
+
+    Fed by httpcore's trace extension, so only requests that go over the
+    network are counted.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.http2_requests = 0
+        self.connections = 0
+        self.tls_handshakes = 0
+        self.connect_time = 0.0
+        self.tls_time = 0.0
+
+    async def trace(self, started: Dict[str, float], event: str, info: Dict[str, Any]):
+        step, _, stage = event.rpartition('.')
+        if stage == 'started':
+            started[step] = time.monotonic()
+            if step.endswith('send_request_headers'):
+                self.requests += 1
+                if step.startswith('http2.'):
+                    self.http2_requests += 1
+        elif stage == 'complete' and step in started:
+            elapsed = time.monotonic() - started[step]
+            if step == 'connection.connect_tcp':
+                self.connections += 1
+                self.connect_time += elapsed
+            elif step == 'connection.start_tls':
+                self.tls_handshakes += 1
+                self.tls_time += elapsed
+
+    @property
+    def reuse_ratio(self) -> Optional[float]:
+        """Fraction of requests sent over an already open connection."""
+        if not self.requests:
+            return None
+        return max(self.requests - self.connections, 0) / self.requests
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'requests': self.requests,
+            'http2_requests': self.http2_requests,
+            'connections': self.connections,
+            'tls_handshakes': self.tls_handshakes,
+            'connect_time': self.connect_time,
+            'tls_time': self.tls_time,
+            'reuse_ratio': self.reuse_ratio,
+        }
+
+
+class RequestStats:
+    """Request statistics grouped by endpoint and by room."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.by_endpoint: Dict[str, EndpointStats] = collections.defaultdict(EndpointStats)
+        self.by_room: Dict[str, EndpointStats] = collections.defaultdict(EndpointStats)
+        self.connections = ConnectionStats()
+
+    @contextlib.contextmanager
+    def call(self, endpoint: str, room: Optional[str] = None):
+        """Attribute requests made inside this block to `endpoint` and `room`."""
+        token = current_call.set((endpoint, room))
+        try:
+            yield
+        finally:
+            current_call.reset(token)
+
+    def record(self, endpoint: str, room: Optional[str], **kwargs):
+        self.by_endpoint[endpoint].record(**kwargs)
+        if room:
+            self.by_room[room].record(**kwargs)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'started': self.started,
+            'exported': time.time(),
+            'latency_buckets': list(LATENCY_BUCKETS),
+            'endpoints': {k: v.as_dict() for k, v in sorted(self.by_endpoint.items())},
+            'rooms': {k: v.as_dict() for k, v in sorted(self.by_room.items())},
+            'connections': self.connections.as_dict(),
+        }
+
+
+class InstrumentedNextCloud(NextCloudAsync):
+    """NextCloudAsync client that records every request in `stats`.
+
+    The API calls the client makes are wrapped so that their requests, and
+    any made on their behalf such as capability lookups, are grouped under
+    the call's name and room.  Anything else is grouped by method and path.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = RequestStats()
+
+        hooks = self.client.event_hooks
+        hooks['request'] = [*hooks['request'], self.trace_connections]
+        self.client.event_hooks = hooks
+
+    async def trace_connections(self, request: httpx.Request):
+        request.extensions['trace'] = functools.partial(self.stats.connections.trace, {})
+
+    async def request(
+            self,
+            method: str = 'GET',
+            url: str = None,
+            sub: str = '',
+            data: Optional[Dict] = {},
+            headers: Optional[Dict] = {}) -> httpx.Response:
+        endpoint, room = current_call.get() or (f'{method} {sub}', None)
+        sent = len(json.dumps(data)) if data and method.upper() != 'GET' else 0
+        status, received, error = None, 0, None
+
+        start = time.monotonic()
+        try:
+            response = await super().request(
+                method=method, url=url, sub=sub, data=data, headers=headers)
+        except NextCloudException as e:
+            # 304 Not Modified is an expected outcome, not an error.
+            status = e.status_code
+            if status != 304:
+                error = type(e).__name__
+            raise
+        except httpx.HTTPError as e:
+            error = type(e).__name__
+            raise
+        else:
+            status = response.status_code
+            received = len(response.content)
+            return response
+        finally:
+            self.stats.record(
+                endpoint, room,
+                elapsed=time.monotonic() - start,
+                status=status,
+                sent=sent,
+                received=received,
+                error=error)
+
+    async def get_user(self, *args, **kwargs):
+        with self.stats.call('get_user'):
+            return await super().get_user(*args, **kwargs)
+
+    async def get_conversations(self, *args, **kwargs):
+        with self.stats.call('get_conversations'):
+            return await super().get_conversations(*args, **kwargs)
+
+    async def get_conversation_messages(self, token: str, *args, **kwargs):
+        long_poll = kwargs.get('look_into_future') and kwargs.get('timeout')
+        endpoint = 'get_conversation_messages' + (' (long-poll)' if long_poll else '')
+        with self.stats.call(endpoint, token):
+            return await super().get_conversation_messages(token, *args, **kwargs)
+
+    async def get_conversation_participants(self, token: str, *args, **kwargs):
+        with self.stats.call('get_conversation_participants', token):
+            return await super().get_conversation_participants(token, *args, **kwargs)
+
+    async def send_to_conversation(self, token: str, *args, **kwargs):
+        with self.stats.call('send_to_conversation', token):
+            return await super().send_to_conversation(token, *args, **kwargs)
+
+    async def download_file(self, *args, **kwargs):
+        with self.stats.call('download_file'):
+            return await super().download_file(*args, **kwargs)
@@ -1,5 +1,5 @@
 import httpx
-import pygubu
+import logging
 import asyncio
 
 from nextcloud_async import NextCloudAsync
@@ -11,8 +11,10 @@ from tkinter import messagebox
 from typing import Dict, Any
 
 from .config import NCTalkConfiguration
-from .constants import PROJECT_PATH, PROJECT_UI
+from .constants import HTTP_VERSION
 from .logs import Logger
+from .transport import create_nextcloud, HAS_HTTP2
+from .ui import ui_builder
 
 
 class LoginWindow:
@@ -35,9 +37,7 @@ class LoginWindow:
 
         self.remember_me = tk.BooleanVar(value=False)
 
-        self.builder = builder = pygubu.Builder()
-        builder.add_resource_path(PROJECT_PATH)
-        builder.add_from_file(PROJECT_UI / 'login.ui')
+        self.builder = builder = ui_builder('login.ui')
 
         # Build the login window and make sure it's on top.
         self.window = builder.get_object('login_window', self.master)
@@ -84,7 +84,6 @@ class LoginWindow:
         """Save the supplied credentials to a config file."""
         self.app_config['user'] = self.username
         self.app_config['endpoint'] = self.endpoint
-        self.app_config.save_config()
 
     def nextcloud_login(self, _):
         """Spawn a job to attempt login to nextcloud."""
@@ -103,16 +102,16 @@ class LoginWindow:
         remember_me = self.builder.tkvariables['remember_me'].get()
 
         await self.logger.log(f'Logging in to {self.endpoint}')
-        self.nca = NextCloudAsync(
-            client=httpx.AsyncClient(timeout=10),
-            user=self.username,
-            password=password,
-            endpoint=self.endpoint)
+
+        if self.app_config.get('http_version', HTTP_VERSION) == 'HTTP/2' and not HAS_HTTP2:
+            await self.logger.log('HTTP/2 needs the h2 package, falling back to HTTP/1.1')
+
+        self.nca = create_nextcloud(self.app_config, self.endpoint, self.username, password)
 
         try:
             self.user = await self.nca.get_user()
         except NextCloudException as e:
-            await self.logger.log(f'Login failed: {e}')
+            await self.logger.log(f'Login failed: {e}', logging.WARNING)
             messagebox.showerror(title='Login Failure', message=e, parent=self.window)
             login_button['state'] = 'normal'
             cancel_button['state'] = 'normal'
@@ -1,36 +1,59 @@
-import asyncio
 import logging
+import logging.handlers
+import queue
+import stat
+import sys
 
-import datetime as dt
-import tkinter as tk
+import platformdirs as pdir
 
+from typing import TextIO
 
-class Logger:
+from .constants import LOG_FILE_BYTES, LOG_FILE_COUNT
 
-    queue = asyncio.Queue()
-    lock = asyncio.Lock()
 
-    def __init__(self, log_widget):
-        self.log_widget = log_widget
+class Logger:
+    """Application log.
+
+    Messages below `level` are dropped as soon as they are logged.  The rest
+    go to `stream` and a rotating log file from a background thread, off the
+    UI path.  AppLogger also shows them in the log window.
+    """
+
+    def __init__(self, level: int = logging.INFO, stream: TextIO = sys.stdout):
+        self.level = level
+
+        self.sink = logging.getLogger('nctalk')
+        self.sink.setLevel(level)
+        self.sink.propagate = False
+        self.listener = self.__start_sink(stream)
+
+    def __start_sink(self, stream: TextIO) -> logging.handlers.QueueListener:
+        log_path = pdir.user_log_path('nctalk')
+        log_path.mkdir(parents=True, exist_ok=True, mode=stat.S_IRWXU)
+
+        formatter = logging.Formatter(
+            '%(asctime)s - %(levelname)s - %(message)s', datefmt=r'%Y/%m/%d %H:%M:%S')
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_path / 'nctalk.log', maxBytes=LOG_FILE_BYTES, backupCount=LOG_FILE_COUNT)
+        stream_handler = logging.StreamHandler(stream)
+        for handler in (file_handler, stream_handler):
+            handler.setFormatter(formatter)
+
+        log_queue = queue.SimpleQueue()
+        self.sink.handlers = [logging.handlers.QueueHandler(log_queue)]
+        listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler)
+        listener.start()
+        return listener
 
     async def __call__(self, *args, **kwargs):
         await self.log(*args, **kwargs)
 
     async def log(self, text: str, level: int = logging.INFO):
-        """Write a message to the application log window and console."""
-        # TODO: Level filtering / debug output
-        # TODO: Text colors based on log level
-        now = dt.datetime.now().strftime(r'%Y/%m/%d %H:%M:%S')
-        line = f'{now} - {text}'
-        await self.queue.put(line)
-
-    async def process_queue(self):
-        """Process logs put into the queue."""
-        while logmsg := await self.queue.get():
-            async with self.lock:
-                self.log_widget.config(state='normal')
-                self.log_widget.insert(tk.END, f'{logmsg}\n')
-                self.log_widget.config(state='disabled')
-                self.log_widget.update()
-                self.log_widget.see(tk.END)
-                print(logmsg)
+        """Write a message to the console and log file."""
+        if level < self.level:
+            return
+
+        self.sink.log(level, text)
+
+    def shutdown(self):
+        self.listener.stop()
@@ -0,0 +1,6 @@
+"""Chat message types."""
+
+from typing import Dict, Any
+
+# A chat message as returned by the Talk API
+Message = Dict[str, Any]
@@ -0,0 +1,144 @@
+"""Send a room's chat messages in order, retrying failures."""
+
+import asyncio
+import collections
+import hashlib
+import httpx
+import logging
+import random
+import uuid
+
+from typing import Awaitable, Callable, Deque, Dict, Optional
+
+from nextcloud_async import NextCloudAsync
+from nextcloud_async.exceptions import (
+    NextCloudException, NextCloudNotModified, NextCloudTooManyRequests)
+
+from .constants import SEND_RETRIES, SEND_BACKOFF, SEND_CHECK_MESSAGES
+from .health import is_server_failure
+from .logs import Logger
+from .task_manager import TaskManager
+
+# Failures after which the message certainly was not posted
+NOT_SENT = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout,
+            NextCloudTooManyRequests)
+
+
+class OutgoingMessage:
+    """A message the user wrote, until the server has it."""
+
+    def __init__(self, text: str):
+        self.text = text
+        # Talk returns this with the message, which identifies our own copy.
+        self.reference_id = hashlib.sha256(uuid.uuid4().bytes).hexdigest()
+        self.error: Optional[BaseException] = None
+
+
+class Outbox:
+    """Send the messages of room `token` one at a time, in the order written.
+
+    Failures that mean the server is in trouble are retried up to `retries`
+    times with exponential backoff and jitter, starting at `backoff` seconds;
+    the messages behind wait their turn.  Other failures, such as a read-only
+    room, are not retried.  `on_sent` or `on_failed` is awaited with each
+    message once it is settled.
+
+    Talk does not deduplicate messages by reference id, so a message is only
+    sent again when the failed attempt certainly never reached the server.
+    After any other failure, such as a timeout waiting for the response, the
+    newest messages of the room are searched for it first.
+
+    Sent messages stay in `pending` until their copy comes back from the
+    server and is claimed with match().
+    """
+
+    def __init__(
+            self,
+            nca: NextCloudAsync,
+            loop: TaskManager,
+            logger: Logger,
+            token: str,
+            on_sent: Callable[[OutgoingMessage], Awaitable[None]],
+            on_failed: Callable[[OutgoingMessage], Awaitable[None]],
+            retries: int = SEND_RETRIES,
+            backoff: float = SEND_BACKOFF):
+
+        self.nca = nca
+        self.loop = loop
+        self.logger = logger
+        self.token = token
+        self.on_sent = on_sent
+        self.on_failed = on_failed
+        self.retries = retries
+        self.backoff = backoff
+
+        self.queue: Deque[OutgoingMessage] = collections.deque()
+        # Reference id -> message, until the server's copy arrives
+        self.pending: Dict[str, OutgoingMessage] = {}
+        # Runs only while there is something to send
+        self.task = None
+
+    def submit(self, text: str) -> OutgoingMessage:
+        """Queue `text` for sending and return its OutgoingMessage."""
+        msg = OutgoingMessage(text)
+        self.queue.append(msg)
+        self.pending[msg.reference_id] = msg
+        if not self.task:
+            self.task = self.loop.create_task(
+                self.send_queued(), name=f'room-{self.token}-send')
+        return msg
+
+    def match(self, reference_id: str) -> Optional[OutgoingMessage]:
+        """Claim the message the server returned with `reference_id`, if it is ours."""
+        return self.pending.pop(reference_id, None) if reference_id else None
+
+    async def send_queued(self):
+        try:
+            while self.queue:
+                await self.send(self.queue[0])
+                self.queue.popleft()
+        finally:
+            self.task = None
+
+    async def send(self, msg: OutgoingMessage):
+        # Whether an earlier attempt may have posted the message after all
+        uncertain = False
+        for attempt in range(self.retries + 1):
+            try:
+                if uncertain and await self.was_posted(msg):
+                    break
+                uncertain = False
+                await self.nca.send_to_conversation(
+                    self.token, msg.text, reference_id=msg.reference_id)
+            except (httpx.HTTPError, NextCloudException) as e:
+                uncertain = uncertain or not isinstance(e, NOT_SENT)
+                if not is_server_failure(e) or attempt == self.retries:
+                    await self.logger(f'Unable to send message: {e!r}', logging.WARNING)
+                    msg.error = e
+                    # If it was posted, its copy still replaces the local one.
+                    if not uncertain:
+                        self.pending.pop(msg.reference_id, None)
+                    await self.on_failed(msg)
+                    return
+                delay = self.backoff * 2 ** attempt
+                await asyncio.sleep(delay + random.random() * delay)
+            else:
+                break
+        await self.on_sent(msg)
+
+    async def was_posted(self, msg: OutgoingMessage) -> bool:
+        """Return whether `msg` is among the newest messages of the room."""
+        try:
+            messages, _ = await self.nca.get_conversation_messages(
+                token=self.token,
+                look_into_future=False,
+                limit=SEND_CHECK_MESSAGES,
+                set_read_marker=False)
+        except NextCloudNotModified:
+            return False
+        return any(m.get('referenceId') == msg.reference_id for m in messages)
+
+    def shutdown(self):
+        if self.task:
+            self.loop.remove(self.task)
+            self.task = None
@@ -2,12 +2,24 @@
 import tkinter as tk
 import pygubu
 
-from tkinter import ttk
+from tkinter import ttk, messagebox
 from tkinter import font as tkfont
 import ttkwidgets
 
 from .config import NCTalkConfiguration
-from .constants import PROJECT_PATH, PROJECT_UI
+from .constants import (
+    HTTP_VERSION, HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY,
+    REQUEST_TIMEOUT)
+from .ui import ui_builder
+
+# Network preferences: configuration key and default
+NETWORK_SETTINGS = (
+    ('http_version', HTTP_VERSION),
+    ('http_max_connections', HTTP_MAX_CONNECTIONS),
+    ('http_max_keepalive', HTTP_MAX_KEEPALIVE),
+    ('http_keepalive_expiry', HTTP_KEEPALIVE_EXPIRY),
+    ('request_timeout', REQUEST_TIMEOUT),
+)
 
 
 class PreferencesWindow:
@@ -18,18 +30,19 @@ class PreferencesWindow:
         self.font: tkfont = font
 
         # Import and build the UI
-        self.builder: pygubu.Builder = pygubu.Builder()
-        self.builder.add_resource_path(PROJECT_PATH)
-        self.builder.add_from_file(PROJECT_UI / 'preferences.ui')
+        self.builder: pygubu.Builder = ui_builder('preferences.ui')
 
         self.window: tk.Toplevel = self.builder.get_object("preferences_window", master)
 
         # Set up empty variables for pygubu
         self.theme_list = None
         self.icon_size = None
+        for key, _ in NETWORK_SETTINGS:
+            setattr(self, key, None)
 
         # Import variables, connect callbacks
-        self.builder.import_variables(self, ["icon_size", "theme_list"])
+        self.builder.import_variables(
+            self, ["icon_size", "theme_list"] + [key for key, _ in NETWORK_SETTINGS])
         self.builder.connect_callbacks(self)
 
         # Configure variables
@@ -50,6 +63,10 @@ class PreferencesWindow:
             self.builder.get_object('font_size_dropdown')
         font_dropdown.set(self.app_config.get('font_size', 11))
 
+        # Fill in the current network settings
+        for key, default in NETWORK_SETTINGS:
+            getattr(self, key).set(self.app_config.get(key, default))
+
     def fill_icon_sizes(self):
         icon_size_combobox: ttk.Combobox = self.builder.get_object('icon_combobox')
         icon_size_combobox.configure(values=[12, 16, 20, 24])
@@ -63,9 +80,24 @@ class PreferencesWindow:
         self.style.theme_use(theme)
 
     def save_preferences(self, event):
-        self.app_config['theme'] = self.style.theme_use()
-        self.app_config['font_family'] = self.font.cget('family')
-        self.app_config['font_size'] = self.font.cget('size')
-        self.app_config['icon_size'] = self.icon_size.get()
-        self.app_config.save_config()
+        """Check every setting, then save them all, or none if any is invalid."""
+        values = {
+            'theme': self.style.theme_use,
+            'font_family': lambda: self.font.cget('family'),
+            'font_size': lambda: self.font.cget('size'),
+            'icon_size': self.icon_size.get,
+            **{key: getattr(self, key).get for key, _ in NETWORK_SETTINGS},
+        }
+        try:
+            for key, value in values.items():
+                values[key] = self.app_config.convert(key, value())
+        except (tk.TclError, ValueError):
+            messagebox.showerror(
+                title='Invalid Setting',
+                message=f'Please enter a valid {key.replace("_", " ")}.',
+                parent=self.window)
+            return
+
+        for key, value in values.items():
+            self.app_config[key] = value
         self.window.destroy()
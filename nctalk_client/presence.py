@@ -0,0 +1,116 @@
+"""Share user status lookups between rooms."""
+
+import asyncio
+import httpx
+import logging
+import time
+
+from typing import Dict, Iterable, List, Tuple
+
+from nextcloud_async import NextCloudAsync
+from nextcloud_async.exceptions import NextCloudException, NextCloudNotFound
+
+from .constants import STATUS_TTL, STATUS_BULK_LIMIT, STATUS_PAGE_SIZE, STATUS_MAX_PAGES
+from .logs import Logger
+from .task_manager import TaskManager
+
+# Participant list colours for each user status
+STATUS_COLORS = {
+    'online': 'green',
+    'away': 'dark orange',
+    'dnd': 'red',
+    'invisible': 'gray',
+    'offline': 'gray',
+}
+
+
+class StatusTracker:
+    """Fetch user statuses for every room, once per user per `ttl` seconds.
+
+    Rooms ask for the statuses of their members and get cached ones when they
+    are fresh.  Users whose status is already being fetched for another room
+    are not fetched again; the room waits for the same request instead.  When
+    more than `bulk_limit` users need fetching at once, the server's full
+    status list is paged through instead of asking for each user, until all
+    of them are seen or STATUS_MAX_PAGES pages are read.
+    """
+
+    def __init__(
+            self,
+            nca: NextCloudAsync,
+            loop: TaskManager,
+            logger: Logger,
+            ttl: float = STATUS_TTL,
+            bulk_limit: int = STATUS_BULK_LIMIT):
+
+        self.nca = nca
+        self.loop = loop
+        self.logger = logger
+        self.ttl = ttl
+        self.bulk_limit = bulk_limit
+
+        # User id -> (status, time.monotonic() when fetched)
+        self.statuses: Dict[str, Tuple[str, float]] = {}
+        # User id -> task fetching that user's status
+        self.pending: Dict[str, asyncio.Task] = {}
+
+    def is_fresh(self, user: str, now: float) -> bool:
+        return user in self.statuses and now - self.statuses[user][1] < self.ttl
+
+    async def get(self, users: Iterable[str]) -> Dict[str, str]:
+        """Return the status of each of `users` that could be determined."""
+        users = list(users)
+        now = time.monotonic()
+
+        stale = [u for u in users if u not in self.pending and not self.is_fresh(u, now)]
+        if stale:
+            task = self.loop.create_task(self.fetch(stale))
+            for user in stale:
+                self.pending[user] = task
+
+        waiting = {self.pending[u] for u in users if u in self.pending}
+        if waiting:
+            await asyncio.wait(waiting)
+
+        return {u: self.statuses[u][0] for u in users if u in self.statuses}
+
+    async def fetch(self, users: List[str]):
+        try:
+            if len(users) > self.bulk_limit:
+                await self.fetch_all(users)
+            else:
+                await asyncio.gather(*(self.fetch_one(user) for user in users))
+        except (httpx.TransportError, NextCloudException) as e:
+            await self.logger(f'Unable to fetch user statuses: {e!r}', logging.WARNING)
+        finally:
+            for user in users:
+                self.pending.pop(user, None)
+
+    async def fetch_one(self, user: str):
+        try:
+            response = await self.nca.get_user_status(user)
+        except NextCloudNotFound:
+            # Users who never set a status have none on the server.
+            status = 'offline'
+        else:
+            status = response.get('status', 'offline')
+        self.statuses[user] = (status, time.monotonic())
+
+    async def fetch_all(self, users: List[str]):
+        wanted = set(users)
+        found = {}
+        for page_number in range(STATUS_MAX_PAGES):
+            page = await self.nca.get_all_user_statuses(
+                limit=STATUS_PAGE_SIZE, offset=page_number * STATUS_PAGE_SIZE)
+            found.update({s['userId']: s['status'] for s in page})
+            if len(page) < STATUS_PAGE_SIZE or wanted <= found.keys():
+                break
+
+        # Users missing from the pages read count as offline until the next
+        # fetch, as do those who never set a status.
+        now = time.monotonic()
+        for user, status in found.items():
+            self.statuses[user] = (status, now)
+        for user in users:
+            if user not in found:
+                self.statuses[user] = ('offline', now)
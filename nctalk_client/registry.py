@@ -0,0 +1,42 @@
+"""Index the open rooms."""
+
+from typing import TYPE_CHECKING, Dict, Iterator, Optional
+
+if TYPE_CHECKING:
+    from .rooms import Room
+
+
+class RoomRegistry:
+    """Open rooms, by conversation token and by notebook tab id.
+
+    A room's tab id is the path name of its widget, so neither lookup needs
+    to ask Tk anything, and rooms that share a display name stay apart.
+    """
+
+    def __init__(self):
+        self.by_token: Dict[str, 'Room'] = {}
+        self.by_tab: Dict[str, 'Room'] = {}
+
+    def add(self, room: 'Room'):
+        self.by_token[room.token] = room
+        if room.tab_id:
+            self.by_tab[room.tab_id] = room
+
+    def remove(self, room: 'Room'):
+        del self.by_token[room.token]
+        self.by_tab.pop(room.tab_id, None)
+
+    def get(self, token: str) -> Optional['Room']:
+        return self.by_token.get(token)
+
+    def for_tab(self, tab_id: str) -> Optional['Room']:
+        return self.by_tab.get(str(tab_id))
+
+    def __contains__(self, token: str) -> bool:
+        return token in self.by_token
+
+    def __iter__(self) -> Iterator['Room']:
+        return iter(list(self.by_token.values()))
+
+    def __len__(self) -> int:
+        return len(self.by_token)
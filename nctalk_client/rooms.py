@@ -1,30 +1,57 @@
 import asyncio
-import httpcore
-import httpx
-import random
-import pygubu
+import bisect
+import collections
+import logging
+import time
 
-import datetime as dt
 import tkinter as tk
 from tkinter import ttk
 
 import pygubu.widgets.simpletooltip as tooltip
 
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 
 from nextcloud_async import NextCloudAsync
 from nextcloud_async.exceptions import NextCloudNotModified
 
 from .icons import Icons
-from .constants import PROJECT_PATH, PROJECT_UI
+from .constants import (
+    RENDER_BUDGET, INITIAL_HISTORY, CHAT_HISTORY_LINES, HISTORY_PAGE,
+    PARTICIPANTS_TTL, INLINE_IMAGE_HEIGHT, IMAGE_VIEWER_HEIGHT)
+from .formatting import MessageFormatter, Segment
 from .logs import Logger
 from .messages import Message
+from .outbox import Outbox, OutgoingMessage
+from .attachments import AttachmentPool
 from .images import Image as Image
-
-
-class Room(object):
-
-    __update_interval: int = 30
+from .presence import StatusTracker, STATUS_COLORS
+from .scheduler import PollScheduler
+from .store import MessageStore
+from .sync import RoomSync
+from .ui import ui_builder
+from .updater import TkUpdater
+
+ATTACHMENT_PLACEHOLDER = '[Loading attachment...]'
+
+# Text widget tag options for each kind of message segment
+TEXT_TAGS = {
+    'time': {'foreground': 'gray'},
+    'actor': {'foreground': 'dark blue'},
+    'system': {'foreground': 'gray'},
+    'day': {'foreground': 'gray', 'justify': 'center'},
+    'mention': {'foreground': 'blue'},
+    'mention_self': {'foreground': 'white', 'background': 'blue'},
+    'file': {'underline': True},
+    'object': {'foreground': 'dark green'},
+    'pending': {'foreground': 'gray'},
+    'failed': {'foreground': 'red'},
+}
+
+
+class Room(RoomSync):
+
+    # Lines kept in the chat widget while following new messages
+    max_lines: int = CHAT_HISTORY_LINES
 
     def __init__(
             self,
@@ -33,30 +60,52 @@ class Room(object):
             logger: Logger,
             notebook: ttk.Notebook,
             user: Dict[str, Any],
-            data: Dict[str, Any]):
+            data: Dict[str, Any],
+            attachments: AttachmentPool,
+            store: MessageStore,
+            statuses: StatusTracker,
+            scheduler: PollScheduler):
 
-        self.__dict__.update(data)
-        self.nca = nca
-        self.loop = loop
-        self.logger = logger
+        super().__init__(nca, loop, logger, data, store)
         self.notebook = notebook
+        self.attachments = attachments
+        self.statuses = statuses
+        self.scheduler = scheduler
 
         self.user = user
 
-        self.images = []
-        self.icons = Icons()
-        self.msg_queue = asyncio.Queue()
-
-        self.last_read = 0
-        self.last_common_read = 0
-
-        self.update_fudge = 0.15
+        # actorId -> actorType of the participants, and when they were fetched
+        self.participants: Dict[str, str] = {}
+        self.participants_fetched = None
+        # Names shown in user_list, in order, and the status each is shown with
+        self.user_list_names: Optional[List[str]] = None
+        self.user_list_status: Dict[str, str] = {}
+
+        # Embedded image name -> PhotoImage, for images still in room_text
+        self.images = {}
+        # Marks of attachment placeholders waiting for their image -> the
+        # download progress they show
+        self.pending_images: Dict[str, str] = {}
+        # Tags of shown images, which open the original when clicked
+        self.image_tags = set()
+        # (message id, line count, day ordinal) of every message in room_text,
+        # oldest first
+        self.rendered = collections.deque()
+        self.rendered_lines = 0
+        self.history_exhausted = False
+        self.history_task = None
+
+        # Messages the user sent are shown right away, below everything
+        # received, until the server's copy arrives.
+        self.outbox = Outbox(
+            nca, loop, logger, self.token,
+            on_sent=self.message_sent,
+            on_failed=self.message_failed)
 
-        self.last_message_date = 0
+        self.icons = Icons()
+        self.formatter = MessageFormatter(user.get('id'))
 
-        self.builder = builder = pygubu.Builder()
-        builder.add_resource_path(PROJECT_PATH)
-        builder.add_from_file(PROJECT_UI / 'room_tab.ui')
+        self.builder = builder = ui_builder('room_tab.ui')
 
         self.frame = tk.Frame()
         self.tab = builder.get_object('room_tab', self.frame)
@@ -69,6 +118,10 @@ class Room(object):
             self.builder.get_object('chat_scroll'),
             wrap='word',
             exportselection=True)
+        for tag, options in TEXT_TAGS.items():
+            self.room_text.tag_configure(tag, **options)
+        # Received messages go in above this mark, messages being sent below it.
+        self.room_text.mark_set('outbox', tk.END)
 
         self.user_list = tk.Listbox(self.builder.get_object('userlist_scroll'))
         self.user_list.insert(tk.END, "Updating...")
@@ -76,190 +129,458 @@ class Room(object):
         self.builder.get_object('chat_scroll').add_child(self.room_text)
         self.builder.get_object('userlist_scroll').add_child(self.user_list)
 
-        self.text_entry: tk.Text = self.builder.get_object('text_entry')
-
-        self.initialize_task = self.loop.create_task(self.initialize_room())
-        self.receive_messages_task = self.loop.create_task(self.receive_messages_loop())
-        self.process_messages_task = self.loop.create_task(self.process_new_messages_loop())
-
-    @property
-    def update_interval(self):
-        return self.__update_interval
+        # Watch scrolling to load older history and trim the window.
+        self.scroll_command = self.room_text['yscrollcommand']
+        self.room_text.configure(yscrollcommand=self.on_scroll)
 
-    @update_interval.setter
-    def update_interval(self, interval: int):
-        if interval < self.__update_interval:
-            self.loop.remove(self.receive_messages_task)
-            self.loop.create_task(self.receive_messages(timeout=1))
-            self.receive_messages_task = self.loop.create_task(self.receive_messages_loop())
+        self.text_entry: tk.Text = self.builder.get_object('text_entry')
 
-        self.__update_interval = interval
+        self.initialize_task = self.loop.supervise(
+            self.initialize_room, name=f'room-{self.token}-initialize')
+        self.process_messages_task = self.loop.supervise(
+            self.process_new_messages_loop, name=f'room-{self.token}-render')
 
     @property
     def widget(self):
         return self.frame
 
     @property
-    def this_tab(self):
-        """Return widget representing tab this room.
-
-        Raises:
-            NextCloudNotFound: If room tab not found (Eek!)
-
-        Returns:
-        """
-        for tab in self.notebook.tabs():
-            tab_name = self.notebook.tab(tab, 'text')
-            if tab_name == self.displayName:
-                return tab
+    def tab_id(self) -> str:
+        """Return the notebook tab id of this room, the path name of its widget."""
+        return str(self.frame)
 
     def tab_configure(self, **kwargs):
-        self.notebook.tab(self.this_tab, **kwargs)
+        self.notebook.tab(self.tab_id, **kwargs)
+
+    def update(self, data: Dict[str, Any]):
+        """Apply fresh conversation data from the room list."""
+        renamed = data.get('displayName', self.displayName) != self.displayName
+        super().update(data)
+        if renamed:
+            self.tab_configure(text=self.displayName)
 
     async def initialize_room(self):
         leave_button = self.builder.get_object('leave_button')
-        leave_icon = await self.icons('power', 16)
+        leave_icon = await self.icons('power')
         leave_button.configure(image=leave_icon)
         leave_button.image = leave_icon
         tooltip.create(leave_button, 'Leave room')
 
-        await self.receive_messages(look_into_future=0, limit=200)
-        self.loop.remove(self.initialize_task)
+        # Render what we already have, then fetch only what is newer.  On a
+        # restart after a failed fetch the stored history is already queued.
+        if not self.last_read:
+            history = self.store.recent(self.token, INITIAL_HISTORY)
+            if history:
+                self.last_read = history[-1]['id']
+                self.last_common_read = self.store.last_common_read(self.token)
+                for msg in history:
+                    await self.msg_queue.put(msg)
+
+        if self.last_read:
+            await self.receive_messages(limit=INITIAL_HISTORY)
+        else:
+            await self.receive_messages(look_into_future=0, limit=INITIAL_HISTORY)
+        self.ready.set()
 
     async def update_participants(self):
-        """Update the participants list."""
-        await self.room_status('updating')
-        await self.logger(f'[{self.displayName}] Updating participant list')
+        """Update the participants list.
+
+        Participants are refetched at most every PARTICIPANTS_TTL seconds, and
+        their statuses come from the StatusTracker shared by all rooms.
+        """
+        if self.participants_fetched is None or \
+                time.monotonic() - self.participants_fetched > PARTICIPANTS_TTL:
+            await self.room_status('updating')
+            await self.logger(f'[{self.displayName}] Updating participant list', logging.DEBUG)
+
+            participants = await self.nca.get_conversation_participants(self.token)
+            self.participants = {p['actorId']: p['actorType'] for p in participants}
+            self.participants_fetched = time.monotonic()
+
+            await self.room_status('healthy')
+
+        statuses = await self.statuses.get(
+            actor for actor, actor_type in self.participants.items() if actor_type == 'users')
+        self.show_participants(statuses)
+
+    def show_participants(self, statuses: Dict[str, str]):
+        """Bring user_list in line with the participants, touching only what changed."""
+        if self.user_list_names is None:
+            # Drop the placeholder
+            self.user_list.delete(0, tk.END)
+            self.user_list_names = []
+
+        names = self.user_list_names
+        current = set(names)
+        wanted = set(self.participants)
+
+        for name in current - wanted:
+            index = bisect.bisect_left(names, name)
+            del names[index]
+            self.user_list.delete(index)
+            self.user_list_status.pop(name, None)
+
+        for name in sorted(wanted - current):
+            index = bisect.bisect_left(names, name)
+            names.insert(index, name)
+            self.user_list.insert(index, name)
+
+        for index, name in enumerate(names):
+            status = statuses.get(name)
+            if status != self.user_list_status.get(name):
+                self.user_list.itemconfigure(index, foreground=STATUS_COLORS.get(status, ''))
+                self.user_list_status[name] = status
+
+        TkUpdater.wake()
 
-        participants = await self.nca.get_conversation_participants(
-            self.token, include_status=True)
+    async def process_new_messages_loop(self):
+        while True:
+            msg = await self.msg_queue.get()
+            await self.render_messages(msg)
 
-        self.user_list.delete(0, tk.END)
-        for part in sorted(participants, key=lambda x: x['actorId']):
-            self.user_list.insert(tk.END, part['actorId'])
+            # Let other rooms render before taking the next batch.
+            await asyncio.sleep(0)
 
-        await self.room_status('healthy')
+    async def render_messages(self, msg: Message):
+        """Render `msg` and as many queued messages as fit in one batch.
 
-    async def receive_messages_loop(self):
-        while True:
-            # Fudge the room refresh interval so we don't make a bunch
-            # of requests all at once.
-            randomized_sleep_interval = (
-                self.update_interval + (
-                    random.random() * self.update_fudge
-                    * self.update_interval * random.choice([-1, 1])))
-            await asyncio.sleep(randomized_sleep_interval)
-
-            try:
-                await self.receive_messages(timeout=1)
-            except httpx.RemoteProtocolError:
-                await self.logger(
-                    f'[{self.displayName}] Server disconnected without response.')
-                await self.room_status('exception')
-
-    async def receive_messages(
+        Consecutive text messages are joined and inserted at once, and the
+        widget is scrolled, trimmed, the tab updated and Tk woken once per
+        batch.  The batch ends when the queue is empty or RENDER_BUDGET
+        seconds have been spent, leaving the rest for the next batch.
+        """
+        deadline = time.monotonic() + RENDER_BUDGET
+        at_bottom = self.room_text.yview()[1] == 1.0
+
+        self.room_text.configure(state='normal')
+        rendered = self.insert_messages(
+            self.queued_messages(msg, deadline), 'outbox',
+            previous_day=self.rendered[-1][2] if self.rendered else None)
+        self.rendered.extend(rendered)
+        self.rendered_lines += sum(lines for _, lines, _ in rendered)
+        if at_bottom:
+            self.trim_history()
+        self.room_text.configure(state='disabled')
+
+        if at_bottom:
+            self.room_text.see(tk.END)
+        self.tab_configure(state='normal')
+        TkUpdater.wake()
+
+    def queued_messages(self, msg: Message, deadline: float) -> Iterable[Message]:
+        yield msg
+        while not self.msg_queue.empty() and time.monotonic() <= deadline:
+            yield self.msg_queue.get_nowait()
+
+    def insert_messages(
             self,
-            look_into_future: bool = True,
-            limit: int = 0,
-            timeout: int = 0):
-        await self.logger(f'[{self.displayName}] Polling for new messages')
-        await self.room_status('updating')
+            messages: Iterable[Message],
+            index: str,
+            previous_day: Optional[int] = None,
+            next_day: Optional[int] = None) -> List[Tuple[int, int, int]]:
+        """Insert `messages`, oldest first, at `index`.
 
-        raised = False
-        try:
-            response, headers = await self.nca.get_conversation_messages(
-                token=self.token,
-                look_into_future=look_into_future,
-                timeout=timeout,
-                last_known_message=self.last_read,
-                set_read_marker=False,
-                limit=limit)
-        except NextCloudNotModified:
-            response, headers = [], {}
-        except httpcore.RemoteProtocolError:
-            self.logger(f'[{self.displayName}] Server closed connection prematurely.')
-            raised = True
-            await self.room_status('exception')
-        else:
-            self.last_read = headers['X-Chat-Last-Given']
-            self.last_common_read = headers['X-Chat-Last-Common-Read']
-        finally:
-            if not raised:
-                await self.room_status('healthy')
+        A day separator goes before each message on a different day than the
+        one before it.  `previous_day` and `next_day` are the day ordinals of
+        the messages already shown just before and after `index`, if any.
+
+        Returns:
+            List[Tuple[int, int, int]]: Message id, number of lines and day
+            ordinal of each message
+
+        """
+        rendered = []
+        chunks = []
+        for msg in messages:
+            if sent := self.outbox.match(msg.get('referenceId')):
+                self.remove_outgoing(sent)
+
+            formatted = self.formatter.format(msg)
+            separator = []
+            if previous_day is not None and formatted.day.ordinal != previous_day:
+                separator.append(self.formatter.day_separator(formatted.day.ordinal))
+            previous_day = formatted.day.ordinal
+
+            if self.formatter.is_image(msg):
+                self.insert_segments(index, chunks + separator)
+                chunks = []
+                line_count = self.insert_image_message(msg, formatted.segments, index)
             else:
-                await self.logger(f'[{self.displayName}] Setting exception health')
+                chunks.extend(separator)
+                chunks.extend(formatted.segments)
+                line_count = formatted.lines
+            line_count += sum(text.count('\n') for text, _ in separator)
+            rendered.append((msg['id'], line_count, formatted.day.ordinal))
+
+        # The separator before the messages already shown counts as part of
+        # the last message inserted, which sits right above it.
+        if rendered and next_day is not None and previous_day != next_day:
+            separator = self.formatter.day_separator(next_day)
+            chunks.append(separator)
+            msg_id, line_count, day = rendered[-1]
+            rendered[-1] = (msg_id, line_count + separator[0].count('\n'), day)
+        self.insert_segments(index, chunks)
+        return rendered
+
+    def insert_segments(self, index: str, segments: List[Segment]):
+        """Insert tagged `segments` at `index` with a single Tk call."""
+        if not segments:
+            return
+        # Text.insert() takes alternating text and tag arguments
+        self.room_text.insert(index, *(item for segment in segments for item in segment))
+
+    def insert_image_message(self, msg: Message, header: List[Segment], index: str) -> int:
+        """Insert `header` and a placeholder for an image at `index`, and queue its download.
+
+        The placeholder is swapped for the image by show_image() once the
+        AttachmentPool has fetched its preview.
 
-        for msg in sorted(response, key=lambda x: x['timestamp']):
-            await self.msg_queue.put(msg)
+        Returns:
+            int: Number of lines inserted
 
-    async def process_new_messages_loop(self):
-        while True:
-            while msg := await self.msg_queue.get():
-                await self.insert_new_message(msg)
-                self.last_read = msg['id']
-                self.tab_configure(state='normal')
-            await asyncio.sleep(1/120)
+        """
+        mark = f'attachment_{msg["id"]}'
+
+        self.insert_segments(index, header)
+        self.room_text.insert(index, '           ')
+        self.room_text.mark_set(mark, index)
+        self.room_text.mark_gravity(mark, tk.LEFT)
+        self.room_text.insert(index, f'{ATTACHMENT_PLACEHOLDER}\n\n')
+        self.pending_images[mark] = ''
+
+        file = msg['messageParameters']['file']
+        self.attachments.submit(
+            file, lambda img: self.show_image(mark, img, file),
+            height=INLINE_IMAGE_HEIGHT,
+            progress=lambda received, total: self.show_progress(mark, received, total))
+        return 3
+
+    def show_progress(self, mark: str, received: int, total: Optional[int]):
+        """Show how much of the image at `mark` has arrived in its placeholder."""
+        if mark not in self.pending_images:
+            return
+        shown = f'{received * 100 // total}%' if total else f'{received // 1024} KB'
+        if shown == self.pending_images[mark]:
+            return
+        self.pending_images[mark] = shown
 
-    async def insert_new_message(self, msg: Message):
-        msg_dt = dt.datetime.fromtimestamp(msg['timestamp'])
-        self.last_message_date = msg_dt.strftime(r'%d')
+        self.room_text.configure(state='normal')
+        self.room_text.delete(mark, f'{mark} lineend')
+        self.room_text.insert(mark, f'{ATTACHMENT_PLACEHOLDER} {shown}')
+        self.room_text.configure(state='disabled')
+        TkUpdater.wake()
 
-        if msg_dt.strftime(r'%d') != self.last_message_date:
-            await self.insert_new_message(f'\n---{msg_dt.strftime(r"%Y-%m-%d")}---\n')
+    async def show_image(self, mark: str, img: Image, file: Dict[str, Any]):
+        """Replace the placeholder at `mark` with `img`, opening `file` when clicked."""
+        image = await img.image(height=INLINE_IMAGE_HEIGHT) if img else None
 
-        msg_timestamp = msg_dt.strftime(r'%H:%M:%S')
-        line = f'({msg_timestamp}) {msg["actorDisplayName"]}: {msg["message"]}\n'
+        # The placeholder may have been trimmed away in the meantime.
+        if mark not in self.pending_images:
+            return
+        del self.pending_images[mark]
+        at_bottom = self.room_text.yview()[1] == 1.0
 
         self.room_text.configure(state='normal')
-        if msg['message'] == '{file}' and 'image' in \
-                msg['messageParameters']['file']['mimetype']:
-            img = Image()
-            image_path = msg['messageParameters']['file']['path']
-            try:
-                await img.from_file(self.nca, image_path)
-            except httpx.RemoteProtocolError:
-                try:
-                    await img.from_file(self.nca, image_path)
-                except httpx.RemoteProtocolError:
-                    self.room_status('exception')
-
-            image = img.image(height=200)
-            self.room_text.insert(
-                tk.INSERT,
-                f'({msg_timestamp}) {msg["actorDisplayName"]} [Sent Attachment]\n')
-            self.room_text.insert(tk.INSERT, '           ')
-            self.room_text.image_create(tk.INSERT, image=image)
-            self.room_text.insert(tk.INSERT, '\n\n')
-            self.images.append(image)
+        self.room_text.delete(mark, f'{mark} lineend')
+        if image:
+            name = self.room_text.image_create(mark, image=image)
+            self.images[name] = image
+            tag = mark.replace('attachment_', 'image_')
+            self.room_text.tag_add(tag, name)
+            self.image_tags.add(tag)
+            self.room_text.tag_bind(
+                tag, '<Button-1>',
+                lambda _: self.loop.create_task(self.open_image(file)))
         else:
-            self.room_text.insert(tk.INSERT, line)
-            self.room_text.update()
+            self.room_text.insert(mark, '[Attachment unavailable]')
+            await self.room_status('exception')
+        self.room_text.mark_unset(mark)
+        self.room_text.configure(state='disabled')
+
+        if at_bottom:
             self.room_text.see(tk.END)
+        TkUpdater.wake()
 
-        self.room_text.configure(state='disabled')
+    async def open_image(self, file: Dict[str, Any]):
+        """Download the original of `file` and show it in a window of its own."""
+        img = await self.attachments.fetch(file)
+        if not img:
+            await self.room_status('exception')
+            return
+        # Scaled down only when taller than the screen allows
+        image = await img.image(
+            height=int(self.room_text.winfo_screenheight() * IMAGE_VIEWER_HEIGHT))
+
+        window = tk.Toplevel(self.frame)
+        window.title(file.get('name', ''))
+        label = tk.Label(window, image=image)
+        label.image = image
+        label.pack()
+        TkUpdater.wake()
+
+    def on_scroll(self, first: str, last: str):
+        self.room_text.tk.call(self.scroll_command, first, last)
+
+        if float(first) == 0.0 and float(last) < 1.0:
+            if not self.history_task and not self.history_exhausted:
+                self.history_task = self.loop.create_task(self.load_older())
+        elif float(last) == 1.0 and self.rendered_lines > self.max_lines:
+            self.room_text.configure(state='normal')
+            self.trim_history()
+            self.room_text.configure(state='disabled')
+
+    def trim_history(self):
+        """Drop the oldest messages beyond max_lines, and their images.
+
+        room_text must be in the 'normal' state.
+        """
+        removed_lines = 0
+        while self.rendered and self.rendered_lines - removed_lines > self.max_lines:
+            msg_id, lines, _ = self.rendered.popleft()
+            removed_lines += lines
+
+            mark = f'attachment_{msg_id}'
+            if mark in self.pending_images:
+                del self.pending_images[mark]
+                self.room_text.mark_unset(mark)
+            tag = f'image_{msg_id}'
+            if tag in self.image_tags:
+                self.image_tags.discard(tag)
+                self.room_text.tag_delete(tag)
+
+        if not removed_lines:
+            return
+
+        self.room_text.delete('1.0', f'{removed_lines + 1}.0')
+        self.rendered_lines -= removed_lines
+        self.history_exhausted = False
+
+        # The message now at the top loses its day separator, as the oldest
+        # message shown never has one; load_older() puts it back if needed.
+        if self.rendered and 'day' in self.room_text.tag_names('1.0'):
+            start, end = self.room_text.tag_nextrange('day', '1.0')
+            separator_lines = self.room_text.get(start, end).count('\n')
+            self.room_text.delete(start, end)
+            msg_id, lines, day = self.rendered[0]
+            self.rendered[0] = (msg_id, lines - separator_lines, day)
+            self.rendered_lines -= separator_lines
+
+        remaining = set(self.room_text.image_names())
+        self.images = {name: img for name, img in self.images.items() if name in remaining}
+
+    async def load_older(self):
+        """Prepend a page of older messages from the store or the server."""
+        try:
+            if not self.rendered:
+                return
+            oldest = self.rendered[0][0]
+
+            older = self.store.older(self.token, oldest, HISTORY_PAGE)
+            if not older:
+                try:
+                    response, _ = await self.nca.get_conversation_messages(
+                        token=self.token,
+                        look_into_future=False,
+                        limit=HISTORY_PAGE,
+                        last_known_message=oldest,
+                        set_read_marker=False)
+                except NextCloudNotModified:
+                    response = []
+                older = sorted(response, key=lambda x: x['id'])
+                self.store.add(self.token, older)
+
+            # Nothing more to load, or the window moved on while we waited.
+            if not older:
+                self.history_exhausted = True
+                return
+            if not self.rendered or self.rendered[0][0] != oldest:
+                return
+
+            top_line = int(self.room_text.index('@0,0').split('.')[0])
+
+            self.room_text.configure(state='normal')
+            self.room_text.mark_set('history', '1.0')
+            rendered = self.insert_messages(older, 'history', next_day=self.rendered[0][2])
+            self.room_text.mark_unset('history')
+            self.room_text.configure(state='disabled')
+
+            self.rendered.extendleft(reversed(rendered))
+            added_lines = sum(lines for _, lines, _ in rendered)
+            self.rendered_lines += added_lines
+
+            # Keep the previously visible messages in place.
+            self.room_text.yview(f'{top_line + added_lines}.0')
+            TkUpdater.wake()
+        finally:
+            self.history_task = None
 
     async def room_status(self, level: str):
+        if level == self.health:
+            return
+        self.health = level
+
         status_label: ttk.Label = self.builder.get_object('status_label')
-        match level:
-            case 'healthy':
-                state_img = await self.icons('healthy', 16)
-            case 'updating':
-                state_img = await self.icons('updating', 16)
-            case 'exception':
-                state_img = await self.icons('exception', 16)
+        state_img = await self.icons(level)
 
         status_label.configure(image=state_img)
         status_label.image = state_img
-        status_label.update()
+        TkUpdater.wake()
+
+    async def redraw_status(self):
+        """Show the room's status again, with icons at the current size."""
+        level, self.health = self.health, None
+        if level:
+            await self.room_status(level)
 
     def send_message(self, _):
-        """Send the user's message to the server."""
+        """Show the user's message and queue it for sending to the server."""
         message = self.text_entry.get('1.0', tk.END).strip()
         self.text_entry.mark_set(tk.INSERT, "1.0")
         self.text_entry.delete('1.0', tk.END)
-        asyncio.gather(self.nca.send_to_conversation(self.token, message))
+        if message:
+            self.show_outgoing(self.outbox.submit(message))
         return 'break'
 
+    def show_outgoing(self, msg: OutgoingMessage):
+        """Show `msg` at the bottom of the room, grayed out until it is received."""
+        now = int(time.time())
+        tag = f'outgoing_{msg.reference_id}'
+        segments = [
+            (f'({self.formatter.days.day_of(now).time_of(now)}) ', ('time', tag)),
+            (f'{self.user.get("displayname", "")}: ', ('actor', tag)),
+            (f'{msg.text}\n', ('pending', tag))]
+
+        self.room_text.configure(state='normal')
+        # Keep the mark above the new text.
+        self.room_text.mark_gravity('outbox', tk.LEFT)
+        self.insert_segments(tk.END, segments)
+        self.room_text.mark_gravity('outbox', tk.RIGHT)
+        self.room_text.configure(state='disabled')
+        self.room_text.see(tk.END)
+        TkUpdater.wake()
+
+    def remove_outgoing(self, msg: OutgoingMessage):
+        """Remove the local copy of `msg`; room_text must be in the 'normal' state."""
+        tag = f'outgoing_{msg.reference_id}'
+        if ranges := self.room_text.tag_ranges(tag):
+            self.room_text.delete(ranges[0], ranges[-1])
+        self.room_text.tag_delete(tag)
+
+    async def message_sent(self, msg: OutgoingMessage):
+        # Fetch it back now rather than on the room's next poll.
+        self.scheduler.poll_now(self)
+
+    async def message_failed(self, msg: OutgoingMessage):
+        tag = f'outgoing_{msg.reference_id}'
+        if not self.room_text.tag_ranges(tag):
+            return
+        self.room_text.configure(state='normal')
+        self.room_text.tag_add('failed', f'{tag}.first', f'{tag}.last')
+        self.room_text.insert(
+            f'{tag}.last - 1 char', f' [Not sent: {msg.error}]', ('failed', tag))
+        self.room_text.configure(state='disabled')
+        TkUpdater.wake()
+
     def insert_newline(self, e):
         """This function intentionally left blank.
 
@@ -268,5 +589,13 @@ class Room(object):
         pass
 
     def close_tab(self):
-        self.loop.remove(self.receive_messages_task)
-        self.loop.remove(self.process_messages_task)
+        """Stop the room's tasks, remove its tab and destroy its widgets."""
+        self.outbox.shutdown()
+        for task in (self.initialize_task, self.process_messages_task, self.history_task):
+            if task:
+                self.loop.remove(task)
+        self.pending_images.clear()
+        self.image_tags.clear()
+        self.images.clear()
+        self.notebook.forget(self.widget)
+        self.frame.destroy()
@@ -0,0 +1,162 @@
+"""Schedule message polling for all rooms."""
+
+import asyncio
+import collections
+import logging
+import time
+
+from typing import Any, Dict
+
+import httpx
+
+from nextcloud_async.exceptions import NextCloudException
+
+from .constants import LONG_POLL_TIMEOUT, BACKGROUND_POLL_INTERVAL, BACKGROUND_POLL_RATE
+from .health import ServerHealth, is_server_failure
+from .logs import Logger
+from .task_manager import TaskManager
+
+
+class PollScheduler:
+    """Poll every room for new messages from a single place.
+
+    The focused room is long-polled: the server holds the request open until a
+    message arrives or `long_poll_timeout` expires, so new messages show up
+    immediately.  Background rooms are polled round-robin, each at most once
+    every `interval` seconds and never more than `rate` requests per second in
+    total, and only once the room list shows they have a new message.
+
+    Nothing is polled until start() supplies `health`, which needs a logged in
+    client; a room focused before then waits.  Every poll waits while `health`
+    considers the server unavailable, and reports its outcome there.  A
+    long-poll that fails is retried after the backoff `health` gives for the
+    current run of failures.  Polls of the same room never overlap, so no
+    message is fetched twice.
+    """
+
+    def __init__(
+            self,
+            loop: TaskManager,
+            logger: Logger,
+            long_poll_timeout: int = LONG_POLL_TIMEOUT,
+            interval: float = BACKGROUND_POLL_INTERVAL,
+            rate: float = BACKGROUND_POLL_RATE):
+
+        self.loop = loop
+        self.logger = logger
+        self.long_poll_timeout = long_poll_timeout
+        self.interval = interval
+        self.rate = rate
+
+        self.rooms = collections.deque()
+        # Room -> lock held while the room is being polled
+        self.locks: Dict[Any, asyncio.Lock] = {}
+        self.focused = None
+        self.long_poll_task = None
+        self.background_task = None
+        self.health = None
+        self.started = asyncio.Event()
+
+    def start(self, health: ServerHealth):
+        self.health = health
+        self.started.set()
+        self.background_task = self.loop.supervise(
+            self.background_loop, name='poll-background')
+
+    def add(self, room):
+        self.rooms.append(room)
+        self.locks[room] = asyncio.Lock()
+
+    def remove(self, room):
+        if room is self.focused:
+            self.focus(None)
+        self.rooms.remove(room)
+        del self.locks[room]
+
+    def poll_now(self, room):
+        """Poll `room` right away instead of waiting for its turn.
+
+        A long-poll held on the focused room already returns as soon as the
+        server has something new, so that room is left to it.  The task is
+        left unnamed: the TaskManager would cancel a running poll of the same
+        name, dropping what it had fetched.
+        """
+        if room is self.focused and self.long_poll_task:
+            return
+        self.loop.create_task(self.poll(room, timeout=0))
+
+    def focus(self, room):
+        """Move the long-poll to `room`.
+
+        Any long-poll held on the previously focused room is cancelled right
+        away; that room falls back to the background rotation.
+        """
+        if room is self.focused:
+            return
+
+        if self.long_poll_task:
+            self.loop.remove(self.long_poll_task)
+            self.long_poll_task = None
+
+        self.focused = room
+        if room:
+            self.long_poll_task = self.loop.supervise(
+                lambda: self.long_poll_loop(room), name='poll-focused')
+
+    @property
+    def background_delay(self) -> float:
+        """Seconds to wait between two background polls."""
+        background_rooms = max(len(self.rooms) - (1 if self.focused else 0), 1)
+        return max(self.interval / background_rooms, 1 / self.rate)
+
+    async def long_poll_loop(self, room):
+        await room.ready.wait()
+        while True:
+            await self.poll(room, timeout=self.long_poll_timeout)
+
+    async def background_loop(self):
+        while True:
+            started = time.monotonic()
+            if room := self.next_background_room():
+                await self.poll(room, timeout=0)
+
+            elapsed = time.monotonic() - started
+            await asyncio.sleep(max(self.background_delay - elapsed, 0))
+
+    def next_background_room(self):
+        """Return the next ready background room with new messages, if any."""
+        for _ in range(len(self.rooms)):
+            room = self.rooms[0]
+            self.rooms.rotate(-1)
+            if room is not self.focused and room.ready.is_set() and room.has_new_messages:
+                return room
+        return None
+
+    async def poll(self, room, timeout: int):
+        await self.started.wait()
+        await self.health.wait()
+        # Removed while waiting
+        if not (lock := self.locks.get(room)):
+            return
+
+        async with lock:
+            try:
+                await room.receive_messages(timeout=timeout)
+            except (httpx.HTTPError, NextCloudException) as e:
+                await self.logger(
+                    f'[{room.displayName}] Polling failed: {e!r}', logging.WARNING)
+                if is_server_failure(e):
+                    await self.health.failed(e)
+                await room.room_status('exception' if self.health.healthy else 'offline')
+            else:
+                self.health.succeeded()
+                return
+
+        if timeout:
+            await asyncio.sleep(self.health.backoff())
+
+    def shutdown(self):
+        self.focus(None)
+        if self.background_task:
+            self.loop.remove(self.background_task)
+            self.background_task = None
@@ -0,0 +1,38 @@
+"""Measure where the time goes during startup."""
+
+import time
+
+from typing import List, Tuple
+
+
+class StartupTimer:
+    """Record the end of each startup phase.
+
+    Timing starts when this module is first imported, which is the first
+    thing nctalk does.
+    """
+
+    started: float = time.perf_counter()
+    marks: List[Tuple[str, float]] = []
+
+    @classmethod
+    def mark(cls, phase: str):
+        """Record that `phase` has just finished."""
+        cls.marks.append((phase, time.perf_counter()))
+
+    @classmethod
+    def phases(cls) -> List[Tuple[str, float]]:
+        """Return each phase with its duration in milliseconds."""
+        phases = []
+        previous = cls.started
+        for phase, finished in cls.marks:
+            phases.append((phase, (finished - previous) * 1000))
+            previous = finished
+        return phases
+
+    @classmethod
+    def report(cls) -> str:
+        lines = [f'{ms:9.1f} ms  {phase}' for phase, ms in cls.phases()]
+        total = (cls.marks[-1][1] - cls.started) * 1000 if cls.marks else 0
+        lines.append(f'{total:9.1f} ms  total')
+        return 'Startup timing:\n' + '\n'.join(lines)
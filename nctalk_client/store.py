@@ -0,0 +1,83 @@
+"""Persist chat history locally between sessions."""
+
+import hashlib
+import json
+import sqlite3
+import stat
+
+from typing import List
+
+import platformdirs as pdir
+
+from .messages import Message
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    token TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (token, id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rooms (
+    token TEXT PRIMARY KEY,
+    last_common_read INTEGER
+);
+"""
+
+
+class MessageStore:
+    """SQLite store of chat messages for one account.
+
+    Messages are keyed by room token and message id.  The highest stored id
+    of a room is its high-water mark: everything up to it has already been
+    fetched, so only newer messages need to come from the server.
+    """
+
+    def __init__(self, endpoint: str, user: str):
+        data_path = pdir.user_data_path('nctalk')
+        data_path.mkdir(parents=True, exist_ok=True, mode=stat.S_IRWXU)
+
+        account = hashlib.sha256(bytes(f'{endpoint}/{user}', 'utf-8')).hexdigest()[:16]
+        self.db_file = data_path / f'messages-{account}.sqlite'
+
+        self.db = sqlite3.connect(self.db_file)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+
+    def recent(self, token: str, limit: int) -> List[Message]:
+        """Return the newest `limit` messages of room `token`, oldest first."""
+        rows = self.db.execute(
+            'SELECT data FROM messages WHERE token = ? ORDER BY id DESC LIMIT ?',
+            (token, limit)).fetchall()
+        return [json.loads(data) for data, in reversed(rows)]
+
+    def older(self, token: str, before: int, limit: int) -> List[Message]:
+        """Return up to `limit` messages of room `token` before id `before`, oldest first."""
+        rows = self.db.execute(
+            'SELECT data FROM messages WHERE token = ? AND id < ? ORDER BY id DESC LIMIT ?',
+            (token, before, limit)).fetchall()
+        return [json.loads(data) for data, in reversed(rows)]
+
+    def add(self, token: str, messages: List[Message]):
+        if not messages:
+            return
+        with self.db:
+            self.db.executemany(
+                'INSERT OR REPLACE INTO messages (token, id, data) VALUES (?, ?, ?)',
+                [(token, msg['id'], json.dumps(msg)) for msg in messages])
+
+    def last_common_read(self, token: str) -> int:
+        row = self.db.execute(
+            'SELECT last_common_read FROM rooms WHERE token = ?', (token,)).fetchone()
+        return row[0] if row and row[0] else 0
+
+    def set_read_marker(self, token: str, last_common_read: int):
+        with self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO rooms (token, last_common_read) VALUES (?, ?)',
+                (token, last_common_read))
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,183 @@
+"""Follow rooms and their messages on the server, without any UI."""
+
+import asyncio
+import httpx
+import logging
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from nextcloud_async import NextCloudAsync
+from nextcloud_async.exceptions import NextCloudException, NextCloudNotModified
+
+from .health import ServerHealth, is_server_failure
+from .logs import Logger
+from .registry import RoomRegistry
+from .store import MessageStore
+from .task_manager import TaskManager
+
+
+class RoomSync:
+    """The part of a room that keeps up with its messages on the server.
+
+    receive_messages() fetches what is newer than `last_read`, saves it in
+    `store` if there is one, and puts it on `msg_queue` oldest first.  The
+    PollScheduler decides when each room is polled.  Room builds the chat tab
+    on top of this; headless mode uses it as is, with one queue for all rooms.
+    """
+
+    def __init__(
+            self,
+            nca: NextCloudAsync,
+            loop: TaskManager,
+            logger: Logger,
+            data: Dict[str, Any],
+            store: Optional[MessageStore] = None,
+            msg_queue: Optional[asyncio.Queue] = None):
+
+        self.__dict__.update(data)
+        self.nca = nca
+        self.loop = loop
+        self.logger = logger
+        self.store = store
+        self.msg_queue = asyncio.Queue() if msg_queue is None else msg_queue
+
+        self.last_read = 0
+        self.last_common_read = 0
+
+        # Set once the initial history has been fetched; the PollScheduler
+        # leaves the room alone until then.
+        self.ready = asyncio.Event()
+
+        self.health = None
+
+    @property
+    def tab_id(self) -> Optional[str]:
+        """Return the notebook tab id of this room; rooms without a UI have none."""
+        return None
+
+    @property
+    def has_new_messages(self) -> bool:
+        """Return whether the room list shows a message newer than the last received."""
+        last_message = getattr(self, 'lastMessage', None)
+        if not isinstance(last_message, dict):
+            return False
+        return last_message.get('id', 0) > self.last_read
+
+    def update(self, data: Dict[str, Any]):
+        """Apply fresh conversation data from the room list."""
+        self.__dict__.update(data)
+
+    async def receive_messages(
+            self,
+            look_into_future: bool = True,
+            limit: int = 0,
+            timeout: int = 0):
+        await self.logger(f'[{self.displayName}] Polling for new messages', logging.DEBUG)
+        await self.room_status('updating')
+
+        try:
+            response, headers = await self.nca.get_conversation_messages(
+                token=self.token,
+                look_into_future=look_into_future,
+                timeout=timeout,
+                last_known_message=self.last_read,
+                set_read_marker=False,
+                limit=limit)
+        except NextCloudNotModified:
+            response, headers = [], {}
+        else:
+            if response:
+                self.last_read = max(msg['id'] for msg in response)
+                if self.store:
+                    self.store.add(self.token, response)
+            if headers.get('X-Chat-Last-Common-Read'):
+                self.last_common_read = int(headers['X-Chat-Last-Common-Read'])
+                if self.store:
+                    self.store.set_read_marker(self.token, self.last_common_read)
+        await self.room_status('healthy')
+
+        for msg in sorted(response, key=lambda x: x['timestamp']):
+            await self.msg_queue.put(msg)
+
+    async def room_status(self, level: str):
+        self.health = level
+
+
+class RoomList:
+    """Keep `rooms` in line with the server's list of conversations.
+
+    Rooms are created with `add_room` and removed with `retire_room`.
+    Normally only conversations modified since the previous refresh are
+    fetched, which adds new rooms and updates changed ones.  A full refresh
+    also retires rooms that are no longer on the list.
+    """
+
+    def __init__(
+            self,
+            nca: NextCloudAsync,
+            logger: Logger,
+            rooms: RoomRegistry,
+            health: ServerHealth,
+            add_room: Callable[[Dict[str, Any]], Awaitable[None]],
+            retire_room: Callable[[Any], None]):
+
+        self.nca = nca
+        self.logger = logger
+        self.rooms = rooms
+        self.health = health
+        self.add_room = add_room
+        self.retire_room = retire_room
+
+        # Server time of the last room list fetch; 0 fetches the full list.
+        self.modified_before = 0
+
+    async def fetch(self, modified_since: int = 0) -> Tuple[List[Dict], int]:
+        """Return the conversations modified since server time `modified_since`.
+
+        Returns:
+            The conversations, all of them if `modified_since` is 0, and the
+            server time to pass as `modified_since` next time.
+        """
+        data: Dict[str, Any] = {'noStatusUpdate': 1}
+        if modified_since:
+            data['modifiedSince'] = modified_since
+
+        conversations, headers = await self.nca.ocs_query(
+            method='GET',
+            sub=f'{self.nca.conv_stub}/room',
+            data=data,
+            include_headers=['X-Nextcloud-Talk-Modified-Before'])
+        return conversations, int(headers['X-Nextcloud-Talk-Modified-Before'] or 0)
+
+    async def refresh_loop(self, interval: float, full_every: int):
+        refreshes = 0
+        while True:
+            await asyncio.sleep(interval)
+            await self.health.wait()
+            refreshes += 1
+            try:
+                await self.refresh(full=refreshes % full_every == 0)
+            except (httpx.HTTPError, NextCloudException) as e:
+                await self.logger(f'Unable to refresh the room list: {e!r}', logging.WARNING)
+                if is_server_failure(e):
+                    await self.health.failed(e)
+            else:
+                self.health.succeeded()
+
+    async def refresh(self, full: bool = False):
+        """Bring the rooms in line with the server's room list."""
+        modified_since = 0 if full else self.modified_before
+        conversations, self.modified_before = await self.fetch(modified_since)
+
+        for data in conversations:
+            if room := self.rooms.get(data['token']):
+                room.update(data)
+            else:
+                await self.logger(f'Joining room "{data["displayName"]}"')
+                await self.add_room(data)
+
+        if not modified_since:
+            tokens = {data['token'] for data in conversations}
+            for room in [room for room in self.rooms if room.token not in tokens]:
+                await self.logger(f'Leaving room "{room.displayName}"')
+                self.retire_room(room)
@@ -1,38 +1,159 @@
 import asyncio
+import functools
+import logging
+import time
+
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Union
+
+from .constants import TASK_MAX_RESTARTS, TASK_RESTART_BACKOFF, TASK_RESTART_BACKOFF_MAX
+
+CoroutineFactory = Callable[[], Coroutine[Any, Any, Any]]
+
+
+class TaskStats:
+    """Run history of every task started under one name."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.running = 0
+        self.runs = 0
+        self.failures = 0
+        self.restarts = 0
+        self.wall_time = 0.0
+        self.last_error: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'running': self.running,
+            'runs': self.runs,
+            'failures': self.failures,
+            'restarts': self.restarts,
+            'wall_time': self.wall_time,
+            'last_error': self.last_error,
+        }
 
 
 class TaskManager:
+    """Run and supervise the application's tasks.
+
+    Named tasks are stored by name, and starting a task under a name that is
+    already running cancels the old one.  Unnamed tasks are tracked under
+    their asyncio name, and their statistics are grouped under the
+    coroutine's qualified name.
+
+    Completion is handled by a done-callback, which records run counts,
+    failures and wall time and logs exceptions.  Tasks started with
+    supervise() are restarted with exponential backoff when they fail, up to
+    `max_restarts` times in a row.
+    """
 
     def __init__(self, event_loop: asyncio.BaseEventLoop):
         self.event_loop: asyncio.BaseEventLoop = event_loop
-        self.tasks: list = []
-        self.create_task(self.check_for_exceptions())
-
-    async def check_for_exceptions(self):
-        while True:
-            await asyncio.sleep(1)
-            for task in self.tasks:
-                if task.done():
-                    try:
-                        e: Exception = task.exception()
-                    except asyncio.CancelledError:
-                        pass
-                    else:
-                        if e:
-                            print("Exception:", task.name, str(e))
-
-    def create_task(self, task):
-        new_task = self.event_loop.create_task(task)
-        self.tasks.append(new_task)
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.stats: Dict[str, TaskStats] = {}
+        self.supervised: Dict[str, Dict[str, Any]] = {}
+        self.log = logging.getLogger('nctalk')
+
+    def create_task(self, coro: Coroutine, name: Optional[str] = None) -> asyncio.Task:
+        stats_name = name or coro.__qualname__
+        stats = self.stats.setdefault(stats_name, TaskStats(stats_name))
+        stats.runs += 1
+        stats.running += 1
+
+        new_task = self.event_loop.create_task(coro, name=name)
+        name = new_task.get_name()
+
+        old_task = self.tasks.pop(name, None)
+        if old_task and not old_task.done():
+            old_task.cancel()
+
+        self.tasks[name] = new_task
+        new_task.add_done_callback(
+            functools.partial(self.__task_done, stats, time.monotonic()))
         return new_task
 
-    def remove(self, task):
-        if not task.done():
+    def supervise(
+            self,
+            factory: CoroutineFactory,
+            name: str,
+            max_restarts: int = TASK_MAX_RESTARTS,
+            backoff: float = TASK_RESTART_BACKOFF) -> asyncio.Task:
+        """Run `factory()` as task `name`, restarting it when it fails."""
+        self.supervised[name] = {
+            'factory': factory,
+            'max_restarts': max_restarts,
+            'backoff': backoff,
+            'failures': 0,
+        }
+        return self.create_task(factory(), name=name)
+
+    def remove(self, task: Union[asyncio.Task, str]):
+        """Cancel a task, by object or name, and stop supervising it."""
+        name = task if isinstance(task, str) else task.get_name()
+        if isinstance(task, str):
+            task = self.tasks.get(name)
+
+        if task is None or self.tasks.get(name) is task:
+            self.supervised.pop(name, None)
+            self.tasks.pop(name, None)
+
+        if task and not task.done():
             task.cancel()
-        self.tasks.remove(task)
+
+    def __task_done(self, stats: TaskStats, started: float, task: asyncio.Task):
+        name = task.get_name()
+        stats.running -= 1
+        stats.wall_time += time.monotonic() - started
+
+        if self.tasks.get(name) is task:
+            del self.tasks[name]
+
+        if task.cancelled():
+            return
+
+        e = task.exception()
+        policy = self.supervised.get(name)
+        if not e:
+            if policy and name not in self.tasks:
+                del self.supervised[name]
+            return
+
+        stats.failures += 1
+        stats.last_error = repr(e)
+        self.log.error(f'Task {name} failed: {e!r}', exc_info=e)
+
+        # Not supervised, or already replaced by a newer task
+        if not policy or name in self.tasks:
+            return
+
+        # A task that ran for a good while before failing starts over.
+        if time.monotonic() - started > TASK_RESTART_BACKOFF_MAX:
+            policy['failures'] = 0
+
+        if policy['failures'] >= policy['max_restarts']:
+            self.log.error(f'Task {name} failed {policy["failures"] + 1} times, giving up')
+            del self.supervised[name]
+            return
+
+        delay = min(policy['backoff'] * 2 ** policy['failures'], TASK_RESTART_BACKOFF_MAX)
+        policy['failures'] += 1
+        self.event_loop.call_later(delay, self.__restart, name, policy)
+
+    def __restart(self, name: str, policy: Dict[str, Any]):
+        # Removed or replaced while waiting out the backoff
+        if self.supervised.get(name) is not policy or name in self.tasks:
+            return
+        self.stats[name].restarts += 1
+        self.create_task(policy['factory'](), name=name)
+
+    def diagnostics(self) -> List[Dict[str, Any]]:
+        """Return run statistics for every task name seen, sorted by name."""
+        return [self.stats[name].as_dict() for name in sorted(self.stats)]
 
     def shutdown(self):
-        for task in self.tasks:
+        self.supervised.clear()
+        for task in list(self.tasks.values()):
             task.cancel()
         self.stop()
 
@@ -0,0 +1,69 @@
+"""Build the HTTP client shared by every request to the server."""
+
+import importlib.util
+import httpx
+
+from nextcloud_async.exceptions import NextCloudException
+
+from .config import NCTalkConfiguration
+from .constants import (
+    HTTP_VERSION, HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY,
+    REQUEST_TIMEOUT, LONG_POLL_MARGIN)
+from .instrumentation import InstrumentedNextCloud
+
+# HTTP/2 support needs the optional h2 package: pip install httpx[http2]
+HAS_HTTP2 = importlib.util.find_spec('h2') is not None
+
+HTTP_VERSIONS = ('HTTP/1.1', 'HTTP/2')
+
+
+async def long_poll_timeout(request: httpx.Request):
+    """Let long-polls wait for as long as the server may hold them open.
+
+    Every other request keeps the client's regular read timeout.
+    """
+    params = request.url.params
+    if params.get('lookIntoFuture') == '1' and params.get('timeout', '0') != '0':
+        request.extensions['timeout'] = {
+            **request.extensions['timeout'],
+            'read': int(params['timeout']) + LONG_POLL_MARGIN}
+
+
+async def raise_server_errors(response: httpx.Response):
+    """Raise on 5xx responses, whose error pages are not OCS responses."""
+    if response.is_server_error:
+        raise NextCloudException(
+            status_code=response.status_code, reason=response.reason_phrase)
+
+
+def create_client(app_config: NCTalkConfiguration) -> httpx.AsyncClient:
+    """Return an AsyncClient configured from the transport preferences.
+
+    With HTTP/2 every request, long-polls included, is multiplexed over one
+    connection per server.  With HTTP/1.1 each request in flight needs its own
+    connection, so the pool is sized for the long-poll, the attachment
+    downloads and the background polls together, and idle connections are
+    kept long enough to be reused by the next background poll.
+    """
+    http2 = app_config.get('http_version', HTTP_VERSION) == 'HTTP/2' and HAS_HTTP2
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=app_config.get('http_max_connections', HTTP_MAX_CONNECTIONS),
+            max_keepalive_connections=app_config.get('http_max_keepalive', HTTP_MAX_KEEPALIVE),
+            keepalive_expiry=app_config.get('http_keepalive_expiry', HTTP_KEEPALIVE_EXPIRY)),
+        timeout=httpx.Timeout(app_config.get('request_timeout', REQUEST_TIMEOUT)),
+        event_hooks={'request': [long_poll_timeout], 'response': [raise_server_errors]})
+
+
+def create_nextcloud(
+        app_config: NCTalkConfiguration,
+        endpoint: str,
+        user: str,
+        password: str) -> InstrumentedNextCloud:
+    """Return a client for `user` on `endpoint`, over a client from create_client()."""
+    return InstrumentedNextCloud(
+        client=create_client(app_config),
+        user=user,
+        password=password,
+        endpoint=endpoint)
@@ -0,0 +1,27 @@
+"""Build windows from the .ui files, parsing each file only once."""
+
+import functools
+import pygubu
+
+from pygubu.component.uidefinition import UIDefinition
+
+from .constants import PROJECT_PATH, PROJECT_UI
+
+
+@functools.lru_cache(maxsize=None)
+def ui_definition(filename: str) -> UIDefinition:
+    definition = UIDefinition()
+    definition.load_file(PROJECT_UI / filename)
+    return definition
+
+
+def ui_builder(filename: str) -> pygubu.Builder:
+    """Return a Builder for the widgets defined in `filename`.
+
+    Builders only read their definition, so every Builder of the same file
+    shares a single parsed copy.
+    """
+    builder = pygubu.Builder()
+    builder.add_resource_path(PROJECT_PATH)
+    builder.uidefinition = ui_definition(filename)
+    return builder
@@ -0,0 +1,149 @@
+"""Drive the Tk event loop from asyncio."""
+
+import asyncio
+import ctypes
+import time
+import _tkinter
+
+import tkinter as tk
+
+from typing import Dict, Optional
+
+from .constants import UPDATE_INTERVAL, IDLE_INTERVAL
+from .task_manager import TaskManager
+
+
+def x11_connection_fd(widget: tk.Misc) -> Optional[int]:
+    """Return the file descriptor of Tk's connection to the X server.
+
+    Tk does not expose this, so dig it out through the C API: the first
+    member of a Tk_Window is its Display pointer.  Returns None on any
+    windowing system other than X11, or if the lookup fails.
+    """
+    if widget.tk.call('tk', 'windowingsystem') != 'x11':
+        return None
+
+    try:
+        # libtk and libX11 are dependencies of _tkinter, so their symbols
+        # resolve through its handle.
+        lib = ctypes.CDLL(_tkinter.__file__)
+        lib.Tk_MainWindow.restype = ctypes.c_void_p
+        lib.Tk_MainWindow.argtypes = [ctypes.c_void_p]
+        lib.XConnectionNumber.restype = ctypes.c_int
+        lib.XConnectionNumber.argtypes = [ctypes.c_void_p]
+
+        tkwin = lib.Tk_MainWindow(widget.tk.interpaddr())
+        if not tkwin:
+            return None
+        display = ctypes.c_void_p.from_address(tkwin).value
+        return lib.XConnectionNumber(display)
+    except (OSError, AttributeError, ValueError):
+        return None
+
+
+class TkUpdater:
+    """Process Tk events from a task on the asyncio loop.
+
+    In 'poll' mode Tk is updated every UPDATE_INTERVAL, busy or not.
+
+    In 'event' mode the X server connection is registered as an asyncio
+    reader, so input wakes the updater immediately.  Code that changes widgets
+    from a coroutine calls TkUpdater.wake() to get the redraw scheduled.
+    Otherwise, the updater only wakes to service Tk timers, backing off from
+    UPDATE_INTERVAL to `idle_interval` while nothing happens, and back to
+    UPDATE_INTERVAL as soon as an event is handled.  If the connection cannot
+    be found, this backoff is all that paces the updater.
+    """
+
+    pending = asyncio.Event()
+
+    def __init__(
+            self,
+            window: tk.Misc,
+            mode: str = 'event',
+            idle_interval: float = IDLE_INTERVAL):
+        self.window = window
+        self.mode = mode
+        self.idle_interval = idle_interval
+        self.fd: Optional[int] = None
+        self.event_loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.wakeups = 0
+        self.events = 0
+
+    @classmethod
+    def wake(cls):
+        """Ask for Tk to be serviced on the next loop iteration."""
+        cls.pending.set()
+
+    def start(self, loop: TaskManager) -> asyncio.Task:
+        if self.mode == 'poll':
+            return loop.supervise(self.poll_loop, name='tk-updater')
+
+        self.fd = x11_connection_fd(self.window)
+        if self.fd is not None:
+            self.event_loop = loop.event_loop
+            self.event_loop.add_reader(self.fd, self.wake)
+        return loop.supervise(self.wait_loop, name='tk-updater')
+
+    def stop(self):
+        if self.fd is not None:
+            self.event_loop.remove_reader(self.fd)
+            self.fd = None
+
+    def process_events(self) -> int:
+        """Handle every pending Tk event without blocking.
+
+        Returns:
+            int: Number of events handled
+
+        """
+        count = 0
+        while self.window.tk.dooneevent(_tkinter.ALL_EVENTS | _tkinter.DONT_WAIT):
+            count += 1
+        return count
+
+    async def poll_loop(self):
+        while True:
+            self.wakeups += 1
+            self.window.update()
+            await asyncio.sleep(UPDATE_INTERVAL)
+
+    async def wait_loop(self):
+        timeout = UPDATE_INTERVAL
+        while True:
+            self.pending.clear()
+            self.wakeups += 1
+            handled = self.process_events()
+            self.events += handled
+
+            # Stay snappy while events are flowing, back off when idle.
+            if handled:
+                timeout = UPDATE_INTERVAL
+            else:
+                timeout = min(timeout * 2, self.idle_interval)
+
+            try:
+                await asyncio.wait_for(self.pending.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def measure_idle_cpu(self, duration: float = 10) -> Dict[str, float]:
+        """Measure process CPU usage and Tk wakeups over `duration` seconds.
+
+        Returns:
+            Dict[str, float]: cpu_percent, wakeups_per_second and events_per_second
+
+        """
+        wall_start = time.monotonic()
+        cpu_start = time.process_time()
+        wakeups_start, events_start = self.wakeups, self.events
+
+        await asyncio.sleep(duration)
+
+        wall = time.monotonic() - wall_start
+        return {
+            'cpu_percent': 100 * (time.process_time() - cpu_start) / wall,
+            'wakeups_per_second': (self.wakeups - wakeups_start) / wall,
+            'events_per_second': (self.events - events_start) / wall,
+        }
@@ -0,0 +1,177 @@
+"""Tests for the chat history kept in a room's Text widget."""
+
+import asyncio
+import collections
+import unittest
+
+from nctalk_client.formatting import MessageFormatter
+from nctalk_client.rooms import Room
+
+DAY = 86400
+# Noon UTC, so that both days stay apart in any local time zone
+FIRST_DAY = 1709553600
+
+
+class TextStub:
+    """Just enough of tk.Text for inserting, trimming and tagging text."""
+
+    def __init__(self):
+        self.chars = []
+        self.marks = {}
+
+    def offset(self, index):
+        if index in ('end', '@0,0'):
+            return len(self.chars) if index == 'end' else 0
+        if index in self.marks:
+            return self.marks[index]
+        line, column = (int(part) for part in index.split('.'))
+        offset = 0
+        while line > 1 and offset < len(self.chars):
+            if self.chars[offset][0] == '\n':
+                line -= 1
+            offset += 1
+        return min(offset + column, len(self.chars))
+
+    def index(self, index):
+        text = self.text()[:self.offset(index)]
+        return f'{text.count(chr(10)) + 1}.{len(text) - text.rfind(chr(10)) - 1}'
+
+    def text(self):
+        return ''.join(char for char, _ in self.chars)
+
+    def insert(self, index, *args):
+        offset = self.offset(index)
+        added = []
+        for position in range(0, len(args), 2):
+            tags = frozenset(args[position + 1]) if position + 1 < len(args) else frozenset()
+            added.extend((char, tags) for char in args[position])
+        self.chars[offset:offset] = added
+        # Marks have right gravity and stay after text inserted at them.
+        for name, mark in self.marks.items():
+            if mark >= offset:
+                self.marks[name] = mark + len(added)
+
+    def delete(self, start, end):
+        start, end = self.offset(start), self.offset(end)
+        del self.chars[start:end]
+        for name, mark in self.marks.items():
+            if mark > start:
+                self.marks[name] = max(start, mark - (end - start))
+
+    def get(self, start, end):
+        return self.text()[self.offset(start):self.offset(end)]
+
+    def tag_names(self, index):
+        offset = self.offset(index)
+        return tuple(self.chars[offset][1]) if offset < len(self.chars) else ()
+
+    def tag_nextrange(self, tag, index):
+        start = self.offset(index)
+        while start < len(self.chars) and tag not in self.chars[start][1]:
+            start += 1
+        if start == len(self.chars):
+            return ()
+        end = start
+        while end < len(self.chars) and tag in self.chars[end][1]:
+            end += 1
+        return self.index(f'1.{start}'), self.index(f'1.{end}')
+
+    def mark_set(self, name, index):
+        self.marks[name] = self.offset(index)
+
+    def mark_unset(self, name):
+        del self.marks[name]
+
+    def image_names(self):
+        return ()
+
+    def configure(self, **options):
+        pass
+
+    def yview(self, *args):
+        pass
+
+    def tag_delete(self, tag):
+        pass
+
+
+class OutboxStub:
+
+    def match(self, reference_id):
+        return None
+
+
+class StoreStub:
+
+    def __init__(self, messages):
+        self.messages = messages
+
+    def older(self, token, oldest, limit):
+        return [msg for msg in self.messages if msg['id'] < oldest][-limit:]
+
+
+def message(msg_id, timestamp):
+    return {
+        'id': msg_id,
+        'timestamp': timestamp,
+        'actorDisplayName': 'Alice',
+        'message': f'message {msg_id}',
+    }
+
+
+class TestHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.messages = [
+            message(msg_id, FIRST_DAY + (msg_id > 3) * DAY + msg_id * 60)
+            for msg_id in range(1, 7)]
+
+        self.room = Room.__new__(Room)
+        self.room.token = 'token'
+        self.room.room_text = TextStub()
+        self.room.formatter = MessageFormatter('alice')
+        self.room.outbox = OutboxStub()
+        self.room.store = StoreStub(self.messages)
+        self.room.rendered = collections.deque()
+        self.room.rendered_lines = 0
+        self.room.pending_images = {}
+        self.room.image_tags = set()
+        self.room.images = {}
+        self.room.history_exhausted = False
+        self.room.history_task = None
+
+        rendered = self.room.insert_messages(self.messages, 'end')
+        self.room.rendered.extend(rendered)
+        self.room.rendered_lines = sum(lines for _, lines, _ in rendered)
+
+    def separators(self):
+        lines = self.room.room_text.text().split('\n')
+        return [line for line in lines if line.startswith('---')]
+
+    def assertLinesCounted(self):
+        self.assertEqual(self.room.rendered_lines, self.room.room_text.text().count('\n'))
+
+    def test_trim_keeps_first_message_of_day_without_separator(self):
+        # Three messages of the first day, a separator and three of the second
+        self.assertEqual(len(self.separators()), 1)
+        self.assertLinesCounted()
+
+        self.room.max_lines = 5
+        self.room.trim_history()
+
+        self.assertEqual([msg_id for msg_id, _, _ in self.room.rendered], [4, 5, 6])
+        self.assertEqual(self.separators(), [])
+        self.assertLinesCounted()
+
+    def test_load_older_after_trim_adds_one_separator(self):
+        self.room.max_lines = 5
+        self.room.trim_history()
+        asyncio.run(self.room.load_older())
+
+        self.assertEqual([msg_id for msg_id, _, _ in self.room.rendered], [1, 2, 3, 4, 5, 6])
+        self.assertEqual(len(self.separators()), 1)
+        self.assertLinesCounted()
+
+
+if __name__ == '__main__':
+    unittest.main()